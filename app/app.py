@@ -1,27 +1,37 @@
 import os
-from pathlib import Path
+import uuid
 from flask import Flask, render_template, flash, jsonify, redirect, request, url_for, session, send_from_directory
+from werkzeug.security import safe_join
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
 from datetime import datetime
-import numpy as np
-import pandas as pd
 import json
-from sqlalchemy import func
 
 from . import yolo
-from .database import db, User, RecipeFavorite, RecipeHistory, RecipeRating, UserPreference, IngredientInventory
+from .database import db, ensure_indexes, User, RecipeFavorite, RecipeRating, RecipeStats, IngredientInventory
 from .config import config
 from .recommendation_engine import PersonalizedRecommender
+from .recipe_recommender import recipe_key
+from .recipe_index import build_recipe_index, get_recipe_index
+from .interaction_tracker import InteractionTracker
+from .profile_cache import LRUCache
+from .event_log import EventLog, EventConsumer
+from .maintenance import compact_recipe_history, explain_hot_queries, rebuild_recipe_stats
 from .youtube_service import get_youtube_service
-from .auth_utils import hash_pass, verify_pass
-from .forms import LoginForm, RegistrationForm, PreferencesForm, RecipeRatingForm, InventoryForm
-ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'webp'}
+from .auth_utils import admin_required, hash_pass, verify_pass
+from .ingredient_mapper import DetectionResult
+from .metrics import metrics
+from .profiler import profiler
+from .upload_store import InMemoryUploadRequest, image_extension, upload_name, upload_writer
+from .logger_config import app_logger as logger
+from .forms import LoginForm, RegistrationForm, PreferencesForm, InventoryForm
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 ROOT_DIR = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_DIR = os.path.join(ROOT_DIR, 'static', 'images', 'upload')
 
 # Create Flask app
 app = Flask(__name__)
+app.request_class = InMemoryUploadRequest
 
 # Load configuration
 app.config.from_object(config[os.environ.get('FLASK_ENV', 'development')])
@@ -29,6 +39,8 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_DIR
 
 # Initialize extensions
 db.init_app(app)
+metrics.init_app(app)
+profiler.init_app(app)
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
@@ -36,21 +48,48 @@ login_manager.login_message_category = 'info'
 
 # Initialize services
 youtube_service = get_youtube_service()
+event_log = EventLog(app.config['EVENT_LOG_PATH']) if app.config['EVENT_LOG_ENABLED'] else None
+interaction_tracker = InteractionTracker(
+    app,
+    write_behind=app.config['HISTORY_WRITE_BEHIND'],
+    flush_size=app.config['HISTORY_FLUSH_SIZE'],
+    flush_interval=app.config['HISTORY_FLUSH_INTERVAL'],
+    event_log=event_log
+)
 recommender = None
 
 # Initialize recommender
 try:
-    recommender = PersonalizedRecommender('./app/static/data/File_name.csv')
-    print("Personalized recipe recommender initialized successfully")
+    recommender = PersonalizedRecommender(
+        './app/static/data/File_name.csv',
+        profile_cache_size=app.config['PROFILE_CACHE_SIZE'],
+        profile_cache_ttl=app.config['PROFILE_CACHE_TTL']
+    )
+    recommender.popularity_refresh_interval = app.config['POPULARITY_REFRESH_INTERVAL']
+    logger.info("Personalized recipe recommender initialized successfully")
 except Exception as e:
-    print(f"Warning: Failed to initialize personalized recommender: {e}")
+    logger.warning("Failed to initialize personalized recommender: %s", e)
     from .recipe_recommender import RecipeRecommender
     try:
         recommender = RecipeRecommender('./app/static/data/File_name.csv')
-        print("Basic recipe recommender initialized")
+        logger.info("Basic recipe recommender initialized")
     except:
         recommender = None
 
+# The plain recipe recommender, whichever recommender is active
+base_recommender = recommender.base_recommender if isinstance(recommender, PersonalizedRecommender) else recommender
+
+# Scored ingredient queries, so the detected ingredient list can be edited without re-uploading
+query_cache = LRUCache(
+    max_size=app.config['QUERY_CACHE_SIZE'],
+    ttl=app.config['QUERY_CACHE_TTL']
+)
+
+metrics.register_cache('query', query_cache)
+if isinstance(recommender, PersonalizedRecommender):
+    metrics.register_cache('profile', recommender.profile_cache)
+    metrics.register_cache('inventory', recommender.inventory_cache)
+
 # User loader for Flask-Login
 @login_manager.user_loader
 def load_user(user_id):
@@ -59,17 +98,70 @@ def load_user(user_id):
 # Initialize database tables on startup
 with app.app_context():
     db.create_all()
-    print("Database tables created")
-# Load recipe CSV
+    metrics.instrument_engine(db.engine)
+    # create_all() skips existing tables, so add indexes declared since
+    created_indexes = ensure_indexes()
+    if created_indexes:
+        logger.info("Created database indexes: %s", ', '.join(created_indexes))
+    logger.info("Database tables created")
+
+# Apply logged interactions in the background (replays anything left from a crash)
+if event_log is not None:
+    if isinstance(recommender, PersonalizedRecommender):
+        recommender.event_log = event_log
+    event_consumer = EventConsumer(
+        app, event_log, recommender,
+        batch_size=app.config['EVENT_LOG_BATCH_SIZE'],
+        poll_interval=app.config['EVENT_LOG_POLL_INTERVAL'],
+        max_attempts=app.config['EVENT_LOG_MAX_ATTEMPTS']
+    )
+    event_consumer.start()
+# Recipe index shared with the recommender (loaded once per process)
 try:
-    df_recipe = pd.read_csv('./app/static/data/File_name.csv', sep='\t')
+    recipe_index = get_recipe_index('./app/static/data/File_name.csv')
 except Exception as e:
-    print(f"Warning: Failed to load recipe file: {e}")
-    df_recipe = None
+    logger.warning("Failed to load recipe file: %s", e)
+    recipe_index = None
+
+@app.cli.command('build-recipe-index')
+def build_recipe_index_command():
+    """Compile File_name.csv into the memory-mapped recipe index"""
+    index = build_recipe_index('./app/static/data/File_name.csv')
+    print(f"Compiled {len(index)} recipes with {len(index.columns)} ingredients")
+
+@app.cli.command('compact-history')
+def compact_history_command():
+    """Roll old recipe views up into per-recipe counters"""
+    compacted = compact_recipe_history(app.config['HISTORY_RETENTION_DAYS'])
+    print(f"Compacted {compacted} recipe history rows")
+
+@app.cli.command('rebuild-recipe-stats')
+def rebuild_recipe_stats_command():
+    """Recompute RecipeStats from ratings, favorites and cooked history"""
+    rebuilt = rebuild_recipe_stats()
+    print(f"Rebuilt stats for {rebuilt} recipes")
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Verify that every hot query is served by an index"""
+    results = explain_hot_queries()
+    for name, (uses_index, plan) in results.items():
+        print(f"[{'ok' if uses_index else 'NO INDEX'}] {name}")
+        print('    ' + plan.replace('\n', '\n    '))
+    if not all(uses_index for uses_index, _ in results.values()):
+        raise SystemExit(1)
+
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def canonical_recipe_id(recipe_id):
+    """Recipe id as the database stores it ("00033" -> "33"), or None if it is not one"""
+    try:
+        return str(recipe_key(recipe_id))
+    except ValueError:
+        return None
+
 ## Login & Registration
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -143,30 +235,6 @@ def logout():
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
-
-def get_current_index():
-    try:
-        image_path = Path(UPLOAD_DIR)
-        image_files = image_path.glob('*.jpg')
-        image_names = []
-        for path in image_files:
-            try:
-                # Try to get the numeric part of the filename
-                name = path.stem  # filename without extension
-                if name.isdigit():
-                    image_names.append(int(name))
-            except:
-                pass
-        if image_names:
-            current_index = max(image_names)
-        else:
-            current_index = 0
-    except: 
-        current_index = 0
-    return current_index
-
-current_index = get_current_index()
-
 @app.route('/favicon.ico')
 def favicon():
     return send_from_directory(os.path.join(app.root_path, 'static'),
@@ -183,30 +251,38 @@ def index():
             return redirect(request.url)
         
         uploaded_files = []
-        all_detected_ingredients = set()
+        all_detected_ingredients = DetectionResult()
         
         for file in files:
             if file and file.filename != '' and allowed_file(file.filename):
-                global current_index 
-                current_index += 1 
-                filename = f"{current_index}.jpg"
+                # Detect from the bytes in memory; the disk copy is only for display
+                data = file.read()
+                # Named by content and real format, whatever the client called it
+                extension = image_extension(data)
+                if extension is None:
+                    logger.warning("Skipping upload %s: not a supported image", file.filename)
+                    continue
+                filename = upload_name(data, extension)
                 filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
+                with metrics.timer('save'):
+                    upload_writer.save(filepath, data)
                 uploaded_files.append(filename)
                 
                 # Detect ingredients from each image
                 try:
-                    ingredients = yolo.image_detect(filepath)
-                    all_detected_ingredients.update(ingredients)
+                    with metrics.timer('detect'):
+                        ingredients = yolo.detect_with_confidence(filepath, image_data=data)
+                    all_detected_ingredients.merge(ingredients)
                 except Exception as e:
-                    print(f"Error detecting ingredients in {filename}: {e}")
+                    logger.error("Error detecting ingredients in %s: %s", filename, e)
         
         if not uploaded_files:
             flash('No valid files uploaded', 'danger')
             return redirect(request.url)
         
         # Store detected ingredients in session for use in kitchen route
-        session['detected_ingredients'] = list(all_detected_ingredients)
+        session['detected_ingredients'] = all_detected_ingredients.ingredients
+        session['detected_confidences'] = all_detected_ingredients.confidences
         session['uploaded_files'] = uploaded_files
         
         # Redirect to kitchen with the first uploaded file
@@ -214,28 +290,10 @@ def index():
     
     return render_template('index.html')
 
-#
-def make_query_string(ingredients):
-    query_str =''
-    if(len(ingredients)==0):
-        return query_str
-    elif(len(ingredients)==1):
-        query_str = ingredients[0] +' == True'
-        return query_str
-    else:
-        for ingredient in ingredients[:-1]:
-            query_str = query_str + ingredient +' == True & '
-        query_str = query_str + ingredients[-1] + ' == True'
-        return query_str
-
-def Query_index(ingredients,dframe):
-    str_query = make_query_string(ingredients)
-    result = dframe.query(str_query)['IndexFile']
-    print('QUERY', result)
-    if(len(result) !=0):
-        return result.tolist()
-    a =  ingredients[:-1]
-    return Query_index(a ,dframe)
+def Query_index(ingredients, index):
+    """Recipes using the longest prefix of ``ingredients`` that any recipe uses"""
+    rows = index.rows_matching_prefix(ingredients)
+    return [int(recipe_id) for recipe_id in index.ids[rows]]
 
 def GetFoodRecipe(index):
     # Convert index to int if it's a string
@@ -243,53 +301,39 @@ def GetFoodRecipe(index):
         index = int(index)
     name_file = f'./app/static/data/Food_recipe/food{index:05d}.json'
     try:
-        with open(name_file) as json_data:
+        with metrics.timer('recipe_json'), open(name_file) as json_data:
             data = json.load(json_data)
         return data
     except Exception as e:
-        print(f"Error loading recipe {index}: {e}")
+        logger.warning("Error loading recipe %s: %s", index, e)
         return None
 
-# These functions are now replaced by the RecipeRecommender class
-def GetVideo(name):
-    # assign some var get response from API below
-    video_api.query(name)
-    #return output as link video
-
-@app.route('/kitchen/<filename>')
-def kitchen(filename):
-    PICTURE_DIR = os.path.join(UPLOAD_DIR, filename)
-    
-    # Check if we have ingredients from multiple uploads in session
-    if 'detected_ingredients' in session:
-        detected_ingredients = session.get('detected_ingredients', [])
-        uploaded_files = session.get('uploaded_files', [filename])
-        # Clear session after use
-        session.pop('detected_ingredients', None)
-        session.pop('uploaded_files', None)
-    else:
-        # Single file upload (backwards compatibility)
-        detected_ingredients = yolo.image_detect(PICTURE_DIR)
-        uploaded_files = [filename]
+def recommend_recipes(detected_ingredients, query, refinement=False):
+    """
+    Up to 7 recipes (unique by name) for a scored ingredient query.
     
-    if len(detected_ingredients) == 0:
-        return render_template('Error.html')
+    ``refinement`` marks an edit of an earlier query, which is neither
+    learned as a new preference signal nor recorded as new recipe views.
+    """
+    if isinstance(recommender, PersonalizedRecommender):
+        recommender.refresh_popularity_if_stale()
     
-    # Get recipes
     if recommender is not None:
         if isinstance(recommender, PersonalizedRecommender) and current_user.is_authenticated:
             # Get personalized recommendations
             recipes = recommender.get_personalized_recipes(
-                current_user, detected_ingredients, top_n=15  # Get more to filter duplicates
+                current_user, detected_ingredients, top_n=15,  # Get more to filter duplicates
+                query=query, update_preferences=not refinement
             )
-            # Track view
-            for recipe in recipes:
-                recommender.track_recipe_view(
-                    current_user.id, recipe['recipe_id'], detected_ingredients
-                )
+            # Track views as one batch
+            if not refinement:
+                viewed_ids = [recipe['recipe_id'] for recipe in recipes]
+                with metrics.timer('history'):
+                    interaction_tracker.record_views(current_user.id, viewed_ids, detected_ingredients)
+                    recommender.note_recipe_views(current_user.id, viewed_ids)
         else:
             # Get basic recommendations using the base recommender
-            result = recommender.base_recommender.find_recipes_by_ingredients(detected_ingredients, top_n=15)
+            result = base_recommender.rank_query(query, top_n=15)
             recipes = []
             seen_recipe_ids = set()
             for recipe_id in result:
@@ -301,7 +345,7 @@ def kitchen(filename):
                         seen_recipe_ids.add(recipe_id)
     else:
         # Fallback
-        result = Query_index(detected_ingredients, df_recipe)
+        result = Query_index(detected_ingredients, recipe_index)
         recipes = []
         seen_recipe_ids = set()
         for recipe_id in result[:15]:  # Get more to filter duplicates
@@ -322,7 +366,55 @@ def kitchen(filename):
             seen_names.add(recipe_name)
             if len(unique_recipes) >= 7:
                 break
-    recipes = unique_recipes
+    return unique_recipes
+
+# These functions are now replaced by the RecipeRecommender class
+def GetVideo(name):
+    # assign some var get response from API below
+    video_api.query(name)
+    #return output as link video
+
+@app.route('/kitchen/<path:filename>')
+def kitchen(filename):
+    # Upload names include their shard directories (see upload_name)
+    PICTURE_DIR = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if PICTURE_DIR is None:
+        return render_template('Error.html')
+    
+    # Check if we have ingredients from multiple uploads in session
+    if 'detected_ingredients' in session:
+        detected_ingredients = session.get('detected_ingredients', [])
+        detected_confidences = session.get('detected_confidences')
+        uploaded_files = session.get('uploaded_files', [filename])
+        # Clear session after use
+        session.pop('detected_ingredients', None)
+        session.pop('detected_confidences', None)
+        session.pop('uploaded_files', None)
+    else:
+        # Single file upload (backwards compatibility); the file may still
+        # be on its way to disk from the worker that took the upload
+        if not upload_writer.wait([PICTURE_DIR]):
+            return render_template('Error.html')
+        with metrics.timer('detect'):
+            detection = yolo.detect_with_confidence(PICTURE_DIR)
+        detected_ingredients = detection.ingredients
+        detected_confidences = detection.confidences
+        uploaded_files = [filename]
+    
+    if len(detected_ingredients) == 0:
+        return render_template('Error.html')
+    
+    # Score the ingredients once; the query is kept so the list can be refined later
+    query = None
+    if base_recommender is not None:
+        with metrics.timer('score'):
+            query = base_recommender.score_query(detected_ingredients, detected_confidences)
+        session['query_token'] = uuid.uuid4().hex
+        query_cache.set(session['query_token'], query)
+    
+    # Get recipes
+    with metrics.timer('recommend'):
+        recipes = recommend_recipes(detected_ingredients, query)
     
     # Add video links with variation to avoid duplicates
     used_video_ids = set()
@@ -335,7 +427,8 @@ def kitchen(filename):
             if ingredients:
                 search_query += f" {ingredients[0]}"
         
-        videos = youtube_service.search_recipe_videos(search_query, max_results=3)
+        with metrics.timer('youtube'):
+            videos = youtube_service.search_recipe_videos(search_query, max_results=3)
         
         # Find a video that hasn't been used yet
         for video in videos:
@@ -351,11 +444,14 @@ def kitchen(filename):
             recipe['video_url'] = videos[0]['embed_url']
             recipe['video_thumbnail'] = videos[0]['thumbnail_url']
     
-    return render_template('kitchen.html', 
-                         img_name=filename,
-                         uploaded_files=uploaded_files,
-                         recipes=recipes,
-                         detected_ingredients=detected_ingredients)
+    # The page links the uploads, so their writes must have landed
+    upload_writer.wait(os.path.join(app.config['UPLOAD_FOLDER'], name) for name in uploaded_files)
+    with metrics.timer('render'):
+        return render_template('kitchen.html', 
+                             img_name=filename,
+                             uploaded_files=uploaded_files,
+                             recipes=recipes,
+                             detected_ingredients=detected_ingredients)
 
 @app.route('/recipe')
 def recipe():
@@ -364,49 +460,53 @@ def recipe():
 # Recipe detail page
 @app.route('/recipe/<recipe_id>')
 def recipe_detail(recipe_id):
-    recipe_data = GetFoodRecipe(recipe_id)
+    # /recipe/00033 and /recipe/33 share favorites, ratings and stats
+    recipe_id = canonical_recipe_id(recipe_id)
+    recipe_data = GetFoodRecipe(recipe_id) if recipe_id else None
     if not recipe_data:
         flash('Recipe not found', 'danger')
         return redirect(url_for('index'))
     
     # Get videos
-    videos = youtube_service.search_recipe_videos(recipe_data.get('name', ''), max_results=3)
-    
-    # Get step-by-step videos if available
-    step_videos = {}
-    if 'instructions' in recipe_data:
-        step_videos = youtube_service.get_step_by_step_videos(
-            recipe_data['name'], recipe_data['instructions']
-        )
+    with metrics.timer('youtube'):
+        videos = youtube_service.search_recipe_videos(recipe_data.get('name', ''), max_results=3)
+        
+        # Get step-by-step videos if available
+        step_videos = {}
+        if 'instructions' in recipe_data:
+            step_videos = youtube_service.get_step_by_step_videos(
+                recipe_data['name'], recipe_data['instructions']
+            )
     
     # Get user rating if logged in
-    user_rating = None
-    if current_user.is_authenticated:
-        rating = RecipeRating.query.filter_by(
-            user_id=current_user.id, recipe_id=recipe_id
-        ).first()
-        user_rating = rating.rating if rating else None
+    with metrics.timer('db'):
+        user_rating = None
+        if current_user.is_authenticated:
+            rating = RecipeRating.query.filter_by(
+                user_id=current_user.id, recipe_id=recipe_id
+            ).first()
+            user_rating = rating.rating if rating else None
+            
+            # Check if favorite
+            is_favorite = RecipeFavorite.query.filter_by(
+                user_id=current_user.id, recipe_id=recipe_id
+            ).first() is not None
+        else:
+            is_favorite = False
         
-        # Check if favorite
-        is_favorite = RecipeFavorite.query.filter_by(
-            user_id=current_user.id, recipe_id=recipe_id
-        ).first() is not None
-    else:
-        is_favorite = False
-    
-    # Get average rating
-    avg_rating = db.session.query(func.avg(RecipeRating.rating)).filter_by(
-        recipe_id=recipe_id
-    ).scalar() or 0
+        # Get average rating from the maintained aggregates
+        stats = db.session.get(RecipeStats, recipe_id)
+        avg_rating = stats.average_rating if stats else 0
     
-    return render_template('recipe_detail.html',
-                         recipe=recipe_data,
-                         recipe_id=recipe_id,
-                         videos=videos,
-                         step_videos=step_videos,
-                         user_rating=user_rating,
-                         avg_rating=avg_rating,
-                         is_favorite=is_favorite)
+    with metrics.timer('render'):
+        return render_template('recipe_detail.html',
+                             recipe=recipe_data,
+                             recipe_id=recipe_id,
+                             videos=videos,
+                             step_videos=step_videos,
+                             user_rating=user_rating,
+                             avg_rating=avg_rating,
+                             is_favorite=is_favorite)
 
 # User preference routes
 @app.route('/preferences', methods=['GET', 'POST'])
@@ -451,6 +551,10 @@ def preferences():
 @app.route('/api/favorite/<recipe_id>', methods=['POST'])
 @login_required
 def toggle_favorite(recipe_id):
+    recipe_id = canonical_recipe_id(recipe_id)
+    if recipe_id is None:
+        return jsonify({'error': 'Invalid recipe'}), 404
+    
     favorite = RecipeFavorite.query.filter_by(
         user_id=current_user.id, recipe_id=recipe_id
     ).first()
@@ -463,12 +567,19 @@ def toggle_favorite(recipe_id):
         db.session.add(favorite)
         is_favorite = True
     
+    RecipeStats.apply_deltas(recipe_id, favorite_count=1 if is_favorite else -1)
     db.session.commit()
+    if isinstance(recommender, PersonalizedRecommender):
+        recommender.invalidate_user_profile(current_user.id)
     return jsonify({'is_favorite': is_favorite})
 
 @app.route('/api/rate/<recipe_id>', methods=['POST'])
 @login_required
 def rate_recipe(recipe_id):
+    recipe_id = canonical_recipe_id(recipe_id)
+    if recipe_id is None:
+        return jsonify({'error': 'Invalid recipe'}), 404
+    
     data = request.get_json()
     rating_value = data.get('rating')
     review = data.get('review', '')
@@ -481,6 +592,7 @@ def rate_recipe(recipe_id):
     ).first()
     
     if rating:
+        RecipeStats.apply_deltas(recipe_id, rating_sum=rating_value - rating.rating)
         rating.rating = rating_value
         rating.review = review
         rating.updated_at = datetime.utcnow()
@@ -492,8 +604,11 @@ def rate_recipe(recipe_id):
             review=review
         )
         db.session.add(rating)
+        RecipeStats.apply_deltas(recipe_id, rating_count=1, rating_sum=rating_value)
     
     db.session.commit()
+    if isinstance(recommender, PersonalizedRecommender):
+        recommender.invalidate_user_profile(current_user.id)
     
     # Update preferences based on rating
     if isinstance(recommender, PersonalizedRecommender) and rating_value >= 4:
@@ -506,10 +621,53 @@ def rate_recipe(recipe_id):
 @app.route('/api/cooked/<recipe_id>', methods=['POST'])
 @login_required
 def mark_cooked(recipe_id):
+    recipe_id = canonical_recipe_id(recipe_id)
+    if recipe_id is None:
+        return jsonify({'error': 'Invalid recipe'}), 404
+    
     if isinstance(recommender, PersonalizedRecommender):
+        # Updates RecipeStats together with the cooked history entry
         recommender.track_recipe_cooked(current_user.id, recipe_id)
+    else:
+        RecipeStats.apply_deltas(recipe_id, cooked_count=1)
+        db.session.commit()
     return jsonify({'success': True})
 
+@app.route('/api/refine', methods=['POST'])
+def refine_recipes():
+    """Re-rank the last kitchen query after adding or removing ingredients"""
+    data = request.get_json(silent=True) or {}
+    add = data.get('add', [])
+    remove = data.get('remove', [])
+    if not isinstance(add, list) or not isinstance(remove, list) or \
+            not all(isinstance(item, str) for item in add + remove):
+        return jsonify({'error': 'add and remove must be lists of ingredients'}), 400
+    
+    token = session.get('query_token')
+    query = query_cache.get(token) if token else None
+    if query is None:
+        return jsonify({'error': 'Ingredient list expired, please upload the image again'}), 404
+    
+    # Ingredients the user adds by hand are taken at full confidence
+    query = base_recommender.refine_query(query, add=dict.fromkeys(add, 1.0), remove=remove)
+    query_cache.set(token, query)
+    
+    recipes = recommend_recipes(query.ingredients, query, refinement=True)
+    return jsonify({
+        'ingredients': query.ingredients,
+        'recipes': [
+            {
+                'recipe_id': recipe['recipe_id'],
+                'name': recipe.get('name'),
+                'description': recipe.get('description'),
+                'time': recipe.get('time'),
+                'ingredients': recipe.get('ingredients'),
+                'url': url_for('recipe_detail', recipe_id=recipe['recipe_id'])
+            }
+            for recipe in recipes
+        ]
+    })
+
 # Inventory management
 @app.route('/inventory', methods=['GET', 'POST'])
 @login_required
@@ -525,23 +683,71 @@ def inventory():
         if item:
             item.quantity = float(form.quantity.data)
             item.unit = form.unit.data
+            item.expiry_date = form.expiry_date.data
             item.updated_at = datetime.utcnow()
         else:
             item = IngredientInventory(
                 user_id=current_user.id,
                 ingredient=form.ingredient.data,
                 quantity=float(form.quantity.data),
-                unit=form.unit.data
+                unit=form.unit.data,
+                expiry_date=form.expiry_date.data
             )
             db.session.add(item)
         
         db.session.commit()
+        if isinstance(recommender, PersonalizedRecommender):
+            recommender.invalidate_user_inventory(current_user.id)
         flash('Inventory updated!', 'success')
         return redirect(url_for('inventory'))
     
     inventory_items = IngredientInventory.query.filter_by(user_id=current_user.id).all()
     return render_template('inventory.html', form=form, items=inventory_items)
 
+@app.route('/api/inventory/recipes')
+@login_required
+def inventory_recipes():
+    """Recipes ranked by how much of them the user's inventory covers"""
+    if not isinstance(recommender, PersonalizedRecommender):
+        return jsonify({'error': 'Inventory recommendations are unavailable'}), 503
+    
+    top_n = min(request.args.get('limit', app.config['DEFAULT_RECIPE_COUNT'], type=int),
+                app.config['MAX_RECIPE_COUNT'])
+    recipes = recommender.get_inventory_recipes(current_user, top_n=max(top_n, 1))
+    return jsonify({
+        'recipes': [
+            {
+                'recipe_id': recipe['recipe_id'],
+                'name': recipe.get('name'),
+                'ingredients': recipe.get('ingredients'),
+                'missing_ingredients': recipe['missing_ingredients'],
+                'url': url_for('recipe_detail', recipe_id=recipe['recipe_id'])
+            }
+            for recipe in recipes
+        ]
+    })
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Stage timings and counters in Prometheus text format"""
+    if not metrics.enabled:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return metrics.response()
+
+@app.route('/admin/profile')
+@admin_required
+def profile_report():
+    """Top functions from sampled requests, or ?format=folded for flame graphs"""
+    if not profiler.enabled:
+        return jsonify({'error': 'Profiler is disabled'}), 404
+    
+    endpoint = request.args.get('endpoint')
+    if request.args.get('format') == 'folded':
+        return profiler.folded(endpoint), 200, {'Content-Type': 'text/plain; charset=utf-8'}
+    
+    limit = min(request.args.get('limit', 25, type=int), 200)
+    return jsonify(profiler.top_functions(limit=limit, endpoint=endpoint))
+
 if __name__ == '__main__':
   app.run(host='127.0.0.1', port=8000, debug=True)
  
\ No newline at end of file
@@ -3,7 +3,7 @@ Authentication utilities for Pic2Kitchen
 """
 import bcrypt
 from functools import wraps
-from flask import redirect, url_for, flash
+from flask import abort, current_app, redirect, url_for, flash
 from flask_login import current_user
 
 def hash_pass(password):
@@ -28,6 +28,18 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def admin_required(f):
+    """Decorator limiting a route to the users listed in ADMIN_USERNAMES"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not current_user.is_authenticated:
+            flash('Please log in to access this page.', 'warning')
+            return redirect(url_for('login'))
+        if current_user.username not in current_app.config.get('ADMIN_USERNAMES', ()):
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
 def get_user_dietary_restrictions(user):
     """Get all dietary restrictions for a user"""
     restrictions = []
@@ -50,27 +62,17 @@ def get_user_dietary_restrictions(user):
     return restrictions
 
 def filter_recipes_by_dietary_restrictions(recipes, user):
-    """Filter recipes based on user's dietary restrictions"""
+    """Filter recipe dicts (with an 'ingredients' list) by the user's restrictions"""
     if not user.is_authenticated:
         return recipes
     
-    restrictions = get_user_dietary_restrictions(user)
-    allergies = user.get_allergies()
+    from .dietary_filter import forbidden_ingredients
+    from .ingredient_registry import get_ingredient_registry
     
-    # Map dietary restrictions to ingredients to avoid
-    ingredient_restrictions = {
-        'vegetarian': ['Beef', 'Pork', 'Chicken', 'Seafood', 'Shrimp', 'Lobster', 
-                      'Crab', 'Squid', 'Oyster', 'Tuna', 'Salmon'],
-        'vegan': ['Beef', 'Pork', 'Chicken', 'Seafood', 'Shrimp', 'Lobster', 
-                  'Crab', 'Squid', 'Oyster', 'Tuna', 'Salmon', 'Egg'],
-        'gluten_free': ['Bread'],
-        'dairy_free': [],  # Would need dairy ingredients in CSV
-        'nut_free': [],  # Would need nut ingredients in CSV
-        'halal': ['Pork'],
-        'kosher': ['Pork', 'Seafood', 'Shrimp', 'Lobster', 'Crab', 'Squid', 'Oyster']
-    }
-    
-    # TODO: Implement actual filtering based on recipe ingredients
-    # This would require loading recipe data and checking ingredients
+    registry = get_ingredient_registry()
+    forbidden_mask = registry.mask_for_ids(forbidden_ingredients(user, registry))
+    if not forbidden_mask:
+        return recipes
     
-    return recipes
\ No newline at end of file
+    return [recipe for recipe in recipes
+            if registry.mask_for(recipe.get('ingredients', [])) & forbidden_mask == 0]
@@ -41,6 +41,44 @@ class Config:
     # Recipe recommendation settings
     DEFAULT_RECIPE_COUNT = 7
     MAX_RECIPE_COUNT = 20
+    
+    # Seconds between refreshes of the popularity ranking used for cold start
+    POPULARITY_REFRESH_INTERVAL = 600
+    
+    # Per-user profile cache (preferences, history, favorites, ratings)
+    PROFILE_CACHE_SIZE = 1024  # Max users held in memory
+    PROFILE_CACHE_TTL = 300  # Seconds before a cached profile is reloaded
+    
+    # Scored ingredient queries kept so users can add/remove ingredients without re-uploading
+    QUERY_CACHE_SIZE = 200  # Queries held in memory (~170 KB each)
+    QUERY_CACHE_TTL = 900  # Seconds a query can still be refined
+    
+    # Per-stage request timing: /metrics (Prometheus text) and Server-Timing headers
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'false').lower() == 'true'
+    
+    # Stack-sampling profiler for a fraction of /kitchen and upload requests
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'false').lower() == 'true'
+    PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', '0.01'))  # Fraction of requests profiled
+    PROFILER_INTERVAL = 0.005  # Seconds between stack samples
+    PROFILER_DIR = os.environ.get('PROFILER_DIR') or 'profiles'  # Folded stacks for flame graphs
+    
+    # Usernames allowed to use the /admin endpoints
+    ADMIN_USERNAMES = {name.strip() for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name.strip()}
+    
+    # Interaction tracking (write-behind buffers history inserts off the request path)
+    HISTORY_WRITE_BEHIND = os.environ.get('HISTORY_WRITE_BEHIND', 'false').lower() == 'true'
+    HISTORY_FLUSH_SIZE = 100  # Flush once this many views are buffered
+    HISTORY_FLUSH_INTERVAL = 5.0  # Seconds between background flushes
+    
+    # History older than this is rolled up into per-recipe counters
+    HISTORY_RETENTION_DAYS = 30
+    
+    # Durable write-behind log for views, cooks and preference updates
+    EVENT_LOG_ENABLED = os.environ.get('EVENT_LOG_ENABLED', 'false').lower() == 'true'
+    EVENT_LOG_PATH = os.environ.get('EVENT_LOG_PATH') or 'events/interactions.db'
+    EVENT_LOG_BATCH_SIZE = 500  # Events applied per database transaction
+    EVENT_LOG_POLL_INTERVAL = 2.0  # Seconds between polls when the log is empty
+    EVENT_LOG_MAX_ATTEMPTS = 3  # Failed applies before an event is dead-lettered
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -3,11 +3,50 @@ Database configuration and models for Pic2Kitchen
 """
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import inspect
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime
 import json
 
 db = SQLAlchemy()
 
+def upsert_insert(model):
+    """
+    Build an INSERT for the bound database that supports ON CONFLICT clauses.
+    
+    Returns None when the dialect has no ON CONFLICT support, so callers can
+    fall back to per-row SELECT/UPDATE.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(model.__table__)
+    if dialect == 'sqlite':
+        return sqlite.insert(model.__table__)
+    return None
+
+def ensure_indexes():
+    """
+    Create any declared index missing from an existing database.
+    
+    db.create_all() skips tables that already exist, so deployments created
+    before an index was declared never get it. Safe to run repeatedly.
+    Returns the names of the indexes that were created.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    
+    return created
+
 class User(db.Model, UserMixin):
     """User model with dietary preferences and allergies"""
     __tablename__ = 'users'
@@ -59,7 +98,10 @@ class RecipeFavorite(db.Model):
     recipe_id = db.Column(db.String(10), nullable=False)  # IndexFile from CSV
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'recipe_id'),
+        db.Index('ix_recipe_favorites_recipe_id', 'recipe_id'),
+    )
 
 class RecipeHistory(db.Model):
     """Track recipes viewed/cooked by users"""
@@ -73,6 +115,28 @@ class RecipeHistory(db.Model):
     cooked_at = db.Column(db.DateTime, nullable=True)
     detected_ingredients = db.Column(db.Text)  # JSON array of detected ingredients
     
+    __table_args__ = (
+        # Windowed history reads: user_id = ? AND viewed_at >= ?
+        db.Index('ix_recipe_history_user_viewed', 'user_id', 'viewed_at'),
+        # Latest view of one recipe (cook tracking)
+        db.Index('ix_recipe_history_user_recipe_viewed', 'user_id', 'recipe_id', 'viewed_at'),
+    )
+
+class RecipeViewSummary(db.Model):
+    """Per-recipe counters for history rows rolled up by compaction"""
+    __tablename__ = 'recipe_view_summaries'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    recipe_id = db.Column(db.String(10), nullable=False)
+    view_count = db.Column(db.Integer, default=0)
+    cooked_count = db.Column(db.Integer, default=0)
+    first_viewed_at = db.Column(db.DateTime, nullable=True)
+    last_viewed_at = db.Column(db.DateTime, nullable=True)
+    last_cooked_at = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id'),)
+    
 class RecipeRating(db.Model):
     """User ratings for recipes"""
     __tablename__ = 'recipe_ratings'
@@ -88,8 +152,68 @@ class RecipeRating(db.Model):
     __table_args__ = (
         db.UniqueConstraint('user_id', 'recipe_id'),
         db.CheckConstraint('rating >= 1 AND rating <= 5'),
+        # Per-recipe averages on the detail page
+        db.Index('ix_recipe_ratings_recipe_id', 'recipe_id'),
     )
 
+class RecipeStats(db.Model):
+    """Per-recipe interaction aggregates, maintained incrementally"""
+    __tablename__ = 'recipe_stats'
+    
+    recipe_id = db.Column(db.String(10), primary_key=True)
+    rating_count = db.Column(db.Integer, default=0, nullable=False)
+    rating_sum = db.Column(db.Integer, default=0, nullable=False)
+    favorite_count = db.Column(db.Integer, default=0, nullable=False)
+    cooked_count = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    @property
+    def average_rating(self):
+        """Mean rating, or 0 when the recipe has no ratings"""
+        return self.rating_sum / self.rating_count if self.rating_count else 0
+    
+    @property
+    def popularity(self):
+        """Engagement score: cooks and favorites, plus ratings above/below 3 stars"""
+        return 3 * self.cooked_count + 2 * self.favorite_count + \
+            (self.rating_sum - 3 * self.rating_count)
+    
+    @classmethod
+    def apply_deltas(cls, recipe_id, rating_count=0, rating_sum=0, favorite_count=0,
+                     cooked_count=0):
+        """
+        Add deltas to a recipe's aggregates in the current transaction.
+        
+        Uses an atomic upsert where supported so concurrent requests never
+        lose increments; the caller commits.
+        """
+        recipe_id = str(recipe_id)
+        deltas = {
+            'rating_count': rating_count,
+            'rating_sum': rating_sum,
+            'favorite_count': favorite_count,
+            'cooked_count': cooked_count
+        }
+        
+        stmt = upsert_insert(cls)
+        if stmt is not None:
+            stmt = stmt.values(recipe_id=recipe_id, updated_at=datetime.utcnow(), **deltas)
+            table = cls.__table__
+            set_ = {name: table.c[name] + stmt.excluded[name] for name in deltas}
+            set_['updated_at'] = stmt.excluded.updated_at
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['recipe_id'], set_=set_
+            ))
+            return
+        
+        stats = db.session.get(cls, recipe_id)
+        if stats is None:
+            stats = cls(recipe_id=recipe_id, rating_count=0, rating_sum=0,
+                        favorite_count=0, cooked_count=0)
+            db.session.add(stats)
+        for name, delta in deltas.items():
+            setattr(stats, name, getattr(stats, name) + delta)
+
 class UserPreference(db.Model):
     """Track user preferences based on behavior"""
     __tablename__ = 'user_preferences'
@@ -0,0 +1,54 @@
+"""
+Bitmask-based dietary restriction and allergy filtering
+"""
+from typing import Set
+
+from .auth_utils import get_user_dietary_restrictions
+from .ingredient_registry import IngredientRegistry, get_ingredient_registry
+
+# Ingredient categories (see INGREDIENT_CATEGORIES) each dietary restriction rules out
+DIETARY_RESTRICTIONS = {
+    'vegetarian': ['meat', 'seafood'],
+    'vegan': ['meat', 'seafood', 'egg'],
+    'gluten_free': ['gluten'],
+    'dairy_free': ['dairy'],  # No dairy ingredients in the recipe index yet
+    'nut_free': ['nuts'],  # No nut ingredients in the recipe index yet
+    'halal': ['pork'],
+    'kosher': ['pork', 'shellfish', 'mollusc', 'mixed_seafood']
+}
+
+# Ingredient categories each allergy rules out
+ALLERGY_RESTRICTIONS = {
+    'eggs': ['egg'],
+    'fish': ['fish'],
+    'shellfish': ['shellfish'],
+    'seafood': ['seafood']
+}
+
+def forbidden_ingredients(user, registry: IngredientRegistry = None) -> Set[int]:
+    """Ids of all ingredients ruled out by a user's diet flags and allergies"""
+    registry = registry or get_ingredient_registry()
+    terms = []
+    for restriction in get_user_dietary_restrictions(user):
+        terms.extend(DIETARY_RESTRICTIONS.get(restriction, []))
+    for allergy in user.get_allergies():
+        terms.extend(ALLERGY_RESTRICTIONS.get(allergy, []))
+    return registry.resolve_terms(terms)
+
+class RestrictionEngine:
+    """
+    Turns restrictions into a forbidden-ingredient bitmask.
+
+    Bits are ingredient registry ids, the same layout as the recipe
+    bitmasks, so a recipe is allowed exactly when
+    ``recipe_mask & forbidden_mask == 0``.
+    """
+
+    def __init__(self, registry: IngredientRegistry = None):
+        self.registry = registry or get_ingredient_registry()
+
+    def forbidden_mask(self, user) -> int:
+        """Bitmask of ingredients the user must not be recommended"""
+        if not user or not user.is_authenticated:
+            return 0
+        return self.registry.mask_for_ids(forbidden_ingredients(user, self.registry))
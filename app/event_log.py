@@ -0,0 +1,291 @@
+"""
+Write-behind event log for recipe interactions
+"""
+import atexit
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Dict, Tuple
+
+from .database import db
+from .interaction_tracker import build_view_rows, insert_view_rows
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+class EventLog:
+    """
+    Append-only local event log backed by a SQLite database in WAL mode.
+
+    Requests append behavioural events (views, cooks, preference updates)
+    with a cheap local insert. Events stay in the log until a consumer has
+    applied them to the main database and acknowledged them, so anything not
+    acknowledged before a crash is replayed on the next start.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS events ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'type TEXT NOT NULL, '
+            'payload TEXT NOT NULL, '
+            'created_at TEXT NOT NULL)'
+        )
+        # Events that kept failing, set aside so later events can be applied
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS dead_events ('
+            'id INTEGER PRIMARY KEY, '
+            'type TEXT NOT NULL, '
+            'payload TEXT NOT NULL, '
+            'created_at TEXT NOT NULL, '
+            'error TEXT, '
+            'failed_at TEXT NOT NULL)'
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections are not shareable"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def append(self, event_type: str, payload: Dict):
+        """Append an event to the log"""
+        conn = self._connection()
+        conn.execute(
+            'INSERT INTO events (type, payload, created_at) VALUES (?, ?, ?)',
+            (event_type, json.dumps(payload), datetime.utcnow().isoformat())
+        )
+        conn.commit()
+
+    def read_batch(self, limit: int = 500) -> List[Tuple[int, str, Dict, datetime]]:
+        """Return the oldest unacknowledged events"""
+        rows = self._connection().execute(
+            'SELECT id, type, payload, created_at FROM events ORDER BY id LIMIT ?',
+            (limit,)
+        ).fetchall()
+        return [
+            (event_id, event_type, json.loads(payload), datetime.fromisoformat(created_at))
+            for event_id, event_type, payload, created_at in rows
+        ]
+
+    def acknowledge(self, last_event_id: int):
+        """Drop every event up to and including ``last_event_id``"""
+        conn = self._connection()
+        conn.execute('DELETE FROM events WHERE id <= ?', (last_event_id,))
+        conn.commit()
+
+    def dead_letter(self, event_id: int, error: str):
+        """Move an event that cannot be applied to the dead_events table"""
+        conn = self._connection()
+        conn.execute(
+            'INSERT OR REPLACE INTO dead_events (id, type, payload, created_at, error, failed_at) '
+            'SELECT id, type, payload, created_at, ?, ? FROM events WHERE id = ?',
+            (error, datetime.utcnow().isoformat(), event_id)
+        )
+        conn.execute('DELETE FROM events WHERE id = ?', (event_id,))
+        conn.commit()
+
+    def pending_count(self) -> int:
+        """Number of events not yet applied"""
+        return self._connection().execute('SELECT COUNT(*) FROM events').fetchone()[0]
+
+    def dead_count(self) -> int:
+        """Number of dead-lettered events"""
+        return self._connection().execute('SELECT COUNT(*) FROM dead_events').fetchone()[0]
+
+class EventConsumer:
+    """
+    Background consumer that batch-applies logged events to the database.
+
+    Events are acknowledged only after the database transaction commits, so
+    delivery is at-least-once. When a batch fails, its events are replayed
+    one at a time; an event that fails ``max_attempts`` times is moved to
+    the log's dead_events table so it cannot hold back the events behind
+    it. A file lock next to the log makes sure only one process consumes
+    it when several workers share the same log.
+    """
+
+    def __init__(self, app, event_log: EventLog, recommender, batch_size: int = 500,
+                 poll_interval: float = 2.0, max_attempts: int = 3):
+        self.app = app
+        self.event_log = event_log
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+
+        # Cooks and preference updates need a PersonalizedRecommender
+        missing = [name for name in ('apply_recipe_cooked', 'apply_preference_update',
+                                     'invalidate_user_profile')
+                   if not callable(getattr(recommender, name, None))]
+        if missing:
+            logger.warning("%s cannot apply %s; cooked and preference events will be skipped",
+                           type(recommender).__name__, ', '.join(missing))
+            recommender = None
+        self.recommender = recommender
+
+        self._failures: Dict[int, int] = {}  # event id -> failed attempts
+        self._stopped = threading.Event()
+        self._worker = None
+        self._lock_file = None
+
+    def start(self) -> bool:
+        """Start consuming if no other process holds the consumer lock"""
+        lock_file = open(self.event_log.path + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        self._lock_file = lock_file
+        self._worker = threading.Thread(target=self._run, name='event-consumer', daemon=True)
+        self._worker.start()
+        atexit.register(self.stop)
+        return True
+
+    def stop(self):
+        """Stop the consumer after draining what is already logged"""
+        self._stopped.set()
+        if self._worker is not None and self._worker.is_alive():
+            self._worker.join(timeout=self.poll_interval + 5)
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def drain(self) -> int:
+        """Apply batches until the log is empty; returns events applied"""
+        applied = 0
+        while True:
+            count = self.process_batch()
+            if count == 0:
+                return applied
+            applied += count
+
+    def process_batch(self) -> int:
+        """
+        Apply one batch of events in a single transaction.
+
+        Returns the number of events acknowledged, applied or dead-lettered.
+        """
+        events = self.event_log.read_batch(self.batch_size)
+        if not events:
+            return 0
+
+        with self.app.app_context():
+            try:
+                self._apply(events)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.warning("Failed to apply %d interaction events, replaying them one at a time: %s",
+                               len(events), e)
+                return self._process_one_by_one(events)
+
+        self._invalidate_profiles(events)
+        self.event_log.acknowledge(events[-1][0])
+        return len(events)
+
+    def _process_one_by_one(self, events: List[Tuple[int, str, Dict, datetime]]) -> int:
+        """Apply events in their own transactions, stopping at one worth retrying"""
+        processed = 0
+        for event in events:
+            event_id, event_type = event[0], event[1]
+            try:
+                self._apply([event])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                attempts = self._failures.get(event_id, 0) + 1
+                if attempts < self.max_attempts:
+                    self._failures[event_id] = attempts
+                    logger.warning("Interaction event %d (%s) failed, attempt %d of %d: %s",
+                                   event_id, event_type, attempts, self.max_attempts, e)
+                    # Later events wait for this one, which is retried on the next poll
+                    return processed
+
+                self._failures.pop(event_id, None)
+                self.event_log.dead_letter(event_id, str(e))
+                metrics.count('interaction_events_dead_lettered', type=event_type)
+                logger.error("Dead-lettered interaction event %d (%s) after %d attempts: %s",
+                             event_id, event_type, attempts, e)
+            else:
+                self._failures.pop(event_id, None)
+                self._invalidate_profiles([event])
+                self.event_log.acknowledge(event_id)
+            processed += 1
+        return processed
+
+    def _invalidate_profiles(self, events: List[Tuple[int, str, Dict, datetime]]):
+        """
+        Drop cached profiles of the users whose events just committed.
+
+        A profile reloaded between the append and the commit holds the old
+        database state; without this it would be served until its TTL ran out.
+        """
+        if self.recommender is None:
+            return
+        for user_id in {payload.get('user_id') for _, _, payload, _ in events}:
+            self.recommender.invalidate_user_profile(user_id)
+
+    def _apply(self, events: List[Tuple[int, str, Dict, datetime]]):
+        """Apply events in log order, grouping consecutive views into one insert"""
+        views = []
+        for _, event_type, payload, created_at in events:
+            if event_type == 'view':
+                views.extend(build_view_rows(
+                    payload['user_id'], payload['recipe_ids'],
+                    payload['detected_ingredients'], created_at
+                ))
+                continue
+
+            # Keep ordering: cooks look up the latest view, so flush views first
+            if views:
+                insert_view_rows(views)
+                views = []
+
+            if event_type in ('cooked', 'preference') and self.recommender is None:
+                logger.warning("Skipping %s event: no personalized recommender", event_type)
+            elif event_type == 'cooked':
+                self.recommender.apply_recipe_cooked(
+                    payload['user_id'], payload['recipe_id'], created_at
+                )
+            elif event_type == 'preference':
+                self.recommender.apply_preference_update(
+                    payload['user_id'], payload['ingredients']
+                )
+            else:
+                logger.warning("Skipping unknown interaction event type: %s", event_type)
+
+        if views:
+            insert_view_rows(views)
+
+    def _run(self):
+        """Poll the log and apply events until stopped"""
+        while not self._stopped.is_set():
+            try:
+                if self.process_batch() == 0:
+                    self._stopped.wait(self.poll_interval)
+            except Exception as e:
+                logger.warning("Interaction event consumer error: %s", e)
+                self._stopped.wait(self.poll_interval)
+
+        try:
+            self.drain()
+        except Exception as e:
+            logger.warning("Failed to drain interaction events on shutdown: %s", e)
@@ -13,6 +13,7 @@ from transformers import (
     DetrForObjectDetection,
     YolosForObjectDetection
 )
+import os
 import numpy as np
 import cv2
 from typing import List, Dict, Tuple, Set
@@ -46,7 +47,7 @@ class AdvancedFoodDetector:
             )
             logger.info("Loaded Food-101 classifier")
         except Exception as e:
-            logger.warning(f"Failed to load Food-101 classifier: {e}")
+            logger.warning("Failed to load Food-101 classifier: %s", e)
         
         # Model 2: DETR for object detection
         try:
@@ -57,7 +58,7 @@ class AdvancedFoodDetector:
             )
             logger.info("Loaded DETR object detector")
         except Exception as e:
-            logger.warning(f"Failed to load DETR: {e}")
+            logger.warning("Failed to load DETR: %s", e)
         
         # Model 3: YOLOS for better food detection
         try:
@@ -68,7 +69,7 @@ class AdvancedFoodDetector:
             )
             logger.info("Loaded YOLOS detector")
         except Exception as e:
-            logger.warning(f"Failed to load YOLOS: {e}")
+            logger.warning("Failed to load YOLOS: %s", e)
         
         # Model 4: Zero-shot classification for flexible detection
         try:
@@ -79,19 +80,31 @@ class AdvancedFoodDetector:
             )
             logger.info("Loaded CLIP for zero-shot classification")
         except Exception as e:
-            logger.warning(f"Failed to load CLIP: {e}")
+            logger.warning("Failed to load CLIP: %s", e)
     
     def detect_ingredients(self, image_path: str) -> List[str]:
         """
         Detect food ingredients using multiple models
         Returns a list of detected ingredients
         """
+        return [item for item, _ in self.detect_ingredients_with_confidence(image_path)]
+    
+    def detect_ingredients_with_confidence(self, image_path: str,
+                                           image: np.ndarray = None) -> List[Tuple[str, float]]:
+        """
+        Detect food ingredients using multiple models
+        Returns (ingredient, confidence) pairs, most confident first
+        
+        ``image`` is the already decoded BGR image, if the caller has one;
+        otherwise the image is read from ``image_path``.
+        """
         detected_items = set()
         confidence_scores = {}
         
         try:
-            # Load image
-            image = Image.open(image_path).convert('RGB')
+            # Load image (once, shared by every method)
+            bgr = image if image is not None else cv2.imread(image_path)
+            image = Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
             
             # Method 1: Food-101 Classification
             if 'food_classifier' in self.models:
@@ -114,7 +127,7 @@ class AdvancedFoodDetector:
                     confidence_scores[item] = max(confidence_scores.get(item, 0), score)
             
             # Method 4: Visual feature analysis
-            visual_items = self._analyze_visual_features(image_path)
+            visual_items = self._analyze_visual_features(bgr)
             for item in visual_items:
                 detected_items.add(item)
                 confidence_scores[item] = max(confidence_scores.get(item, 0), 0.3)
@@ -123,8 +136,8 @@ class AdvancedFoodDetector:
             final_items = self._post_process_detections(detected_items, confidence_scores)
             
         except Exception as e:
-            logger.error(f"Error in ingredient detection: {e}")
-            final_items = ['chicken', 'tomato', 'onion']  # Fallback
+            logger.error("Error in ingredient detection: %s", e)
+            final_items = [(item, 0.1) for item in ['chicken', 'tomato', 'onion']]  # Fallback
         
         return final_items
     
@@ -176,7 +189,7 @@ class AdvancedFoodDetector:
                     items.append((label, score))
                     
         except Exception as e:
-            logger.warning(f"Food-101 detection failed: {e}")
+            logger.warning("Food-101 detection failed: %s", e)
         
         return items
     
@@ -238,7 +251,7 @@ class AdvancedFoodDetector:
                             items.append((label.replace('_', ' '), score))
                             
             except Exception as e:
-                logger.warning(f"{model_name} detection failed: {e}")
+                logger.warning("%s detection failed: %s", model_name, e)
         
         return items
     
@@ -293,17 +306,15 @@ class AdvancedFoodDetector:
                         items.append((label, score))
                     
         except Exception as e:
-            logger.warning(f"CLIP detection failed: {e}")
+            logger.warning("CLIP detection failed: %s", e)
         
         return items
     
-    def _analyze_visual_features(self, image_path: str) -> List[str]:
-        """Analyze visual features of the image"""
+    def _analyze_visual_features(self, img: np.ndarray) -> List[str]:
+        """Analyze visual features of a BGR image"""
         items = []
         
         try:
-            # Load image with OpenCV
-            img = cv2.imread(image_path)
             img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
             
             # Convert to HSV for better color analysis
@@ -336,13 +347,13 @@ class AdvancedFoodDetector:
                     items.extend(['blueberry'])
                 
         except Exception as e:
-            logger.warning(f"Visual analysis failed: {e}")
+            logger.warning("Visual analysis failed: %s", e)
         
         return list(set(items))
     
     def _post_process_detections(self, detected_items: Set[str], 
-                               confidence_scores: Dict[str, float]) -> List[str]:
-        """Post-process and filter detected items"""
+                               confidence_scores: Dict[str, float]) -> List[Tuple[str, float]]:
+        """Post-process and filter detected items, keeping their confidences"""
         
         # Remove duplicates and sort by confidence
         sorted_items = sorted(
@@ -357,15 +368,15 @@ class AdvancedFoodDetector:
         
         for item, score in sorted_items:
             if item.lower() not in non_ingredients and score > 0.1:
-                filtered_items.append(item.lower())
+                filtered_items.append((item.lower(), score))
         
         # Ensure we have at least 3 items
         if len(filtered_items) < 3:
-            # Add common ingredients that weren't detected
+            # Add common ingredients that weren't detected (low confidence)
             common = ['onion', 'garlic', 'salt', 'oil', 'pepper']
             for item in common:
-                if item not in filtered_items:
-                    filtered_items.append(item)
+                if item not in [name for name, _ in filtered_items]:
+                    filtered_items.append((item, 0.1))
                 if len(filtered_items) >= 3:
                     break
         
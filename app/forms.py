@@ -2,8 +2,8 @@
 Forms for Pic2Kitchen application
 """
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SelectMultipleField, TextAreaField, IntegerField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, NumberRange
+from wtforms import StringField, PasswordField, BooleanField, SelectMultipleField, TextAreaField, IntegerField, DateField
+from wtforms.validators import DataRequired, Email, EqualTo, Length, ValidationError, NumberRange, Optional
 from wtforms.widgets import CheckboxInput, ListWidget
 
 class MultiCheckboxField(SelectMultipleField):
@@ -84,4 +84,5 @@ class InventoryForm(FlaskForm):
     """Form for managing ingredient inventory"""
     ingredient = StringField('Ingredient', validators=[DataRequired(), Length(max=50)])
     quantity = StringField('Quantity', validators=[DataRequired()])
-    unit = StringField('Unit', validators=[DataRequired(), Length(max=20)])
\ No newline at end of file
+    unit = StringField('Unit', validators=[DataRequired(), Length(max=20)])
+    expiry_date = DateField('Expiry date', validators=[Optional()])
\ No newline at end of file
@@ -0,0 +1,181 @@
+"""
+Nearest-neighbour ingredient lookup over embedded ingredient names
+"""
+import logging
+import os
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from gensim.models import Doc2Vec, KeyedVectors
+except ImportError:
+    Doc2Vec = KeyedVectors = None
+
+try:
+    import torch
+    from transformers import CLIPModel, CLIPTokenizer
+except ImportError:
+    torch = CLIPModel = CLIPTokenizer = None
+
+from .ingredient_registry import BASE_DIR, Ingredient
+
+logger = logging.getLogger(__name__)
+
+# Word vectors for semantic matching: the deployed Doc2Vec model by default,
+# or any gensim .kv / word2vec .bin/.txt file
+VECTORS_PATH = (os.environ.get('INGREDIENT_VECTORS_PATH')
+                or os.path.join(BASE_DIR, 'static/data/d2v_v4.model'))
+
+# CLIP model for text embeddings when no word vectors ship; the same one
+# the Hugging Face food detectors use for zero-shot classification
+CLIP_MODEL = os.environ.get('INGREDIENT_CLIP_MODEL', 'openai/clip-vit-base-patch32')
+
+# Buckets for hashed character trigrams
+NGRAM_DIM = 1024
+
+def char_ngrams(word: str, n: int = 3) -> List[str]:
+    """Character n-grams of a word, padded so prefixes and suffixes count"""
+    padded = f' {word} '
+    return [padded[i:i + n] for i in range(len(padded) - n + 1)]
+
+class NgramEncoder:
+    """
+    Hashed character trigram vectors.
+
+    Needs no model files and catches spelling variants ("chiken",
+    "tomatoe"), but knows nothing about meaning, so it is only used for
+    misspellings. One changed letter in a short word is already a
+    different food ("beet" vs "beef" scores 0.5), hence the high bar.
+    """
+
+    name = 'ngram'
+    threshold = 0.6  # Cosine similarity a match must exceed
+
+    def encode(self, text: str) -> Optional[np.ndarray]:
+        vector = np.zeros(NGRAM_DIM, dtype=np.float32)
+        for word in text.split():
+            for gram in char_ngrams(word):
+                vector[zlib.crc32(gram.encode()) % NGRAM_DIM] += 1
+        return vector if vector.any() else None
+
+class WordVectorEncoder:
+    """
+    Mean of pretrained word vectors over the words of a label.
+
+    Related words land close together ("lettuce" near "salad"), so this
+    resolves labels that share no spelling with any ingredient.
+    """
+
+    name = 'word2vec'
+    threshold = 0.55
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def encode(self, text: str) -> Optional[np.ndarray]:
+        words = [word for word in text.replace('_', ' ').split() if word in self.vectors.key_to_index]
+        if not words:
+            return None
+        return np.mean([self.vectors[word] for word in words], axis=0).astype(np.float32)
+
+class ClipTextEncoder:
+    """
+    CLIP text embeddings of a label.
+
+    Learnt from image captions, so foods that look and are described alike
+    land close together, and every label gets a vector, not just the words
+    a word vector file happens to know.
+    """
+
+    name = 'clip'
+    # CLIP text embeddings of any two short food words sit around 0.7-0.8
+    threshold = 0.85
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+
+    def encode(self, text: str) -> Optional[np.ndarray]:
+        inputs = self.tokenizer([text], padding=True, return_tensors='pt')
+        with torch.no_grad():
+            features = self.model.get_text_features(**inputs)
+        return features[0].numpy().astype(np.float32)
+
+def load_clip_encoder(model_name: str = CLIP_MODEL):
+    """CLIP text encoder, or None when transformers or the model are unavailable"""
+    if CLIPModel is None:
+        return None
+    try:
+        model = CLIPModel.from_pretrained(model_name)
+        tokenizer = CLIPTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        logger.warning("Could not load CLIP model %s: %s", model_name, e)
+        return None
+    model.eval()
+    logger.info("Loaded CLIP text encoder %s for ingredient matching", model_name)
+    return ClipTextEncoder(model, tokenizer)
+
+def load_encoder(vectors_path: str = VECTORS_PATH):
+    """
+    Semantic label encoder: word vectors when a vectors file ships, else
+    the CLIP text encoder, else n-grams (which the mapper treats as
+    spelling-only).
+    """
+    # build.sh leaves an empty placeholder until the real model is uploaded
+    if not vectors_path or not os.path.isfile(vectors_path) or not os.path.getsize(vectors_path):
+        return load_clip_encoder() or NgramEncoder()
+    if KeyedVectors is None:
+        logger.warning("gensim is not installed; cannot load word vectors from %s", vectors_path)
+        return load_clip_encoder() or NgramEncoder()
+
+    try:
+        if vectors_path.endswith('.model'):
+            vectors = Doc2Vec.load(vectors_path, mmap='r').wv
+        elif vectors_path.endswith('.kv'):
+            vectors = KeyedVectors.load(vectors_path, mmap='r')
+        else:
+            vectors = KeyedVectors.load_word2vec_format(vectors_path, binary=vectors_path.endswith('.bin'))
+    except Exception as e:
+        logger.warning("Could not load word vectors from %s: %s", vectors_path, e)
+        return load_clip_encoder() or NgramEncoder()
+
+    logger.info("Loaded ingredient word vectors from %s", vectors_path)
+    return WordVectorEncoder(vectors)
+
+class IngredientEmbeddings:
+    """
+    Ingredient names and aliases embedded once, searched by cosine similarity.
+
+    The matrix has one unit-length row per name or alias, a few dozen rows
+    in all, so a lookup is a single small matrix-vector product.
+    """
+
+    def __init__(self, ingredients: Iterable[Ingredient], encoder=None):
+        self.encoder = encoder or NgramEncoder()
+
+        rows, ids = [], []
+        for ingredient in ingredients:
+            for text in [ingredient.name] + ingredient.aliases:
+                vector = self.encoder.encode(text.lower())
+                if vector is not None:
+                    rows.append(vector / np.linalg.norm(vector))
+                    ids.append(ingredient.id)
+
+        self.ids = np.array(ids, dtype=np.int32)
+        self.matrix = np.array(rows, dtype=np.float32).reshape(len(rows), -1)
+
+    def nearest(self, label: str) -> Optional[Tuple[int, float]]:
+        """(ingredient id, similarity) closest to a label, or None unless it beats the threshold"""
+        if not len(self.ids):
+            return None
+        vector = self.encoder.encode(label)
+        if vector is None:
+            return None
+
+        similarities = self.matrix @ (vector / np.linalg.norm(vector))
+        best = int(np.argmax(similarities))
+        if similarities[best] <= self.encoder.threshold:
+            return None
+        return int(self.ids[best]), float(similarities[best])
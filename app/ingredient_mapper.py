@@ -1,28 +1,68 @@
 """
 Comprehensive ingredient mapping system for robust food detection
 """
+import logging
 import re
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import List, Dict, Iterable, Optional, Tuple
+
+from .ingredient_embeddings import IngredientEmbeddings, NgramEncoder, load_encoder
+from .ingredient_registry import IngredientRegistry, get_ingredient_registry
+
+logger = logging.getLogger(__name__)
+
+# Confidence given to ingredients inferred from colors/shapes rather than detected
+HINT_CONFIDENCE = 0.3
+
+# Confidence given to default ingredients used when nothing was recognised
+FALLBACK_CONFIDENCE = 0.1
+
+class DetectionResult:
+    """Detected ingredients, in ranking order, with the confidence behind each"""
+    
+    def __init__(self, confidences: Dict[str, float] = None):
+        self.confidences = {}  # ingredient -> confidence (0-1)
+        for ingredient, confidence in (confidences or {}).items():
+            self.add(ingredient, confidence)
+    
+    @property
+    def ingredients(self) -> List[str]:
+        return list(self.confidences)
+    
+    def add(self, ingredient: str, confidence: float):
+        """Add an ingredient, keeping the highest confidence seen for it"""
+        confidence = float(confidence)
+        if confidence > self.confidences.get(ingredient, -1.0):
+            self.confidences[ingredient] = confidence
+    
+    def merge(self, other: 'DetectionResult'):
+        """Fold in the detections from another image"""
+        for ingredient, confidence in other.confidences.items():
+            self.add(ingredient, confidence)
+    
+    def __len__(self):
+        return len(self.confidences)
 
 class IngredientMapper:
     """Maps detected objects to standardized ingredient names"""
     
-    def __init__(self):
-        # All ingredients from File_name.csv
-        self.valid_ingredients = [
-            'Seafood', 'Oyster', 'Crab', 'Salad', 'Squid', 'Shrimp', 'Lobster',
-            'Carrot', 'Cabbage', 'Pumpkin', 'Squash', 'Tomato', 'Potato', 'Radish',
-            'Cucumber', 'Mushroom', 'Bread', 'Egg', 'Pork', 'Beef', 'Chicken',
-            'Tuna', 'Salmon'
-        ]
-        
-        # Comprehensive mapping from COCO classes and variations to our ingredients
+    def __init__(self, registry: IngredientRegistry = None, encoder=None):
+        # All ingredients of the recipe index
+        self.registry = registry or get_ingredient_registry()
+        self.valid_ingredients = list(self.registry.names)
+        
+        # Semantic label embedder for the nearest-neighbour step; an
+        # NgramEncoder here means spelling matches only
+        self.encoder = encoder or load_encoder()
+        
+        # Comprehensive mapping from COCO classes and variations to our ingredients.
+        # Targets must be recipe index ingredients; None marks a label to ignore.
         self.coco_mappings = {
-            # Direct food items in COCO
-            'banana': 'Banana',
-            'apple': 'Apple',
+            # Direct food items in COCO (the recipe index has no fruit)
+            'banana': None,
+            'apple': None,
             'sandwich': 'Bread',
-            'orange': 'Orange',
+            'orange': None,
             'broccoli': 'Cabbage',  # Close vegetable
             'carrot': 'Carrot',
             'hot dog': 'Pork',
@@ -30,10 +70,10 @@ class IngredientMapper:
             'donut': 'Bread',
             'cake': 'Bread',
             
-            # Kitchen items that might indicate food
-            'bottle': 'Beverage',
-            'wine glass': 'Wine',
-            'cup': 'Beverage',
+            # Kitchen items (drinks are not recipe ingredients)
+            'bottle': None,
+            'wine glass': None,
+            'cup': None,
             'fork': None,
             'knife': None,
             'spoon': None,
@@ -43,7 +83,7 @@ class IngredientMapper:
             
             # Animals that map to meat
             'cow': 'Beef',
-            'sheep': 'Lamb',
+            'sheep': None,  # No lamb in the recipe index
             'bird': 'Chicken',
             
             # Person detection - ignore
@@ -61,12 +101,20 @@ class IngredientMapper:
             'bench': None,
             
             # Other potential food-related items
-            'potted plant': 'Herbs',
+            'potted plant': None,
             'oven': None,
             'toaster': None,
             'microwave': None,
             'refrigerator': None,
-            'sink': None
+            'sink': None,
+            
+            # Food-101 / CLIP dish labels: the dish's main recipe ingredient
+            'fried rice': 'Egg',
+            'omelette': 'Egg',
+            'french fries': 'Potato',
+            'hamburger': 'Beef',
+            'red pepper': 'Tomato',  # No peppers in the recipe index; closest fruit vegetable
+            'bell pepper': 'Tomato'
         }
         
         # Additional keyword mappings for better detection
@@ -133,62 +181,148 @@ class IngredientMapper:
             r'radi.*': 'Radish',
             r'sala.*': 'Salad'
         }
+        
+        self.compile()
+    
+    def compile(self):
+        """
+        Precompile the mapping tables into lookup structures.
+        
+        Call again after changing any of the tables; this also clears the
+        memo of resolved labels.
+        """
+        valid = set(self.valid_ingredients)
+        
+        # Steps 1-2: exact COCO mappings win over exact ingredient names,
+        # registry aliases fill in labels neither of them covers
+        self._exact = {ing.lower(): ing for ing in self.valid_ingredients}
+        self._ignored = set()
+        for label, mapped in self.coco_mappings.items():
+            if mapped and mapped in valid:
+                self._exact[label] = mapped
+            else:
+                # Non-food objects must not reach the fuzzy steps ("car" -> Carrot)
+                self._ignored.add(label)
+        for ingredient in self.registry.ingredients:
+            if ingredient.name in valid:
+                for alias in ingredient.aliases:
+                    self._exact.setdefault(alias.lower(), ingredient.name)
+        
+        # COCO targets the recipe index has no column for are ignored like None
+        self.unmapped_targets = sorted({
+            mapped for mapped in self.coco_mappings.values() if mapped and mapped not in valid
+        })
+        if self.unmapped_targets:
+            logger.warning("COCO mappings without a recipe ingredient are ignored: %s",
+                           ', '.join(self.unmapped_targets))
+        
+        # Step 3: one alternation, tried left to right like the pattern loop
+        fuzzy = [(pattern, ing) for pattern, ing in self.fuzzy_patterns.items() if ing in valid]
+        self._fuzzy_targets = {f'p{i}': ing for i, (_, ing) in enumerate(fuzzy)}
+        self._fuzzy = re.compile('|'.join(
+            f'(?P<p{i}>{pattern})' for i, (pattern, _) in enumerate(fuzzy)
+        )) if fuzzy else None
+        
+        # Step 4: first valid ingredient per keyword, in table order
+        self._keywords = []
+        for keyword, ingredients in self.keyword_mappings.items():
+            for ing in ingredients:
+                if ing in valid:
+                    self._keywords.append((keyword, ing))
+                    break
+        
+        # Step 5: lowercase names for partial matching
+        self._partial = [(ing.lower(), ing) for ing in self.valid_ingredients]
+        
+        # Step 6: nearest ingredient name or alias by meaning
+        embedded = [ing for ing in self.registry.ingredients if ing.name in valid]
+        self._embeddings = None
+        if not isinstance(self.encoder, NgramEncoder):
+            self._embeddings = IngredientEmbeddings(embedded, self.encoder)
+        
+        # Step 7: nearest ingredient name or alias by spelling, for misspelled labels
+        self._spelling = IngredientEmbeddings(embedded, NgramEncoder())
+        
+        self._resolve = lru_cache(maxsize=4096)(self._resolve_label)
     
     def map_to_ingredient(self, detected_object: str) -> Optional[str]:
         """Map a detected object to a valid ingredient"""
-        detected_lower = detected_object.lower().strip()
-        
-        # 1. Check direct COCO mappings
-        if detected_lower in self.coco_mappings:
-            mapped = self.coco_mappings[detected_lower]
-            if mapped and mapped in self.valid_ingredients:
-                return mapped
-        
-        # 2. Check if it's already a valid ingredient (case-insensitive)
-        for valid_ing in self.valid_ingredients:
-            if detected_lower == valid_ing.lower():
-                return valid_ing
-        
-        # 3. Check fuzzy patterns
-        for pattern, ingredient in self.fuzzy_patterns.items():
-            if re.match(pattern, detected_lower):
-                if ingredient in self.valid_ingredients:
-                    return ingredient
-        
-        # 4. Check keyword mappings
-        for keyword, ingredients in self.keyword_mappings.items():
+        # Food-101 class names use underscores ("fried_rice")
+        return self._resolve(detected_object.lower().replace('_', ' ').strip())
+    
+    def map_to_id(self, detected_object: str) -> Optional[int]:
+        """Map a detected object to an ingredient registry id"""
+        ingredient = self.map_to_ingredient(detected_object)
+        return self.registry.resolve(ingredient) if ingredient else None
+    
+    def _resolve_label(self, detected_lower: str) -> Optional[str]:
+        """Resolve a normalized label with the compiled tables (memoized)"""
+        exact = self._exact.get(detected_lower)
+        if exact:
+            return exact
+        if detected_lower in self._ignored:
+            return None
+        
+        if self._fuzzy is not None:
+            match = self._fuzzy.match(detected_lower)
+            if match:
+                return self._fuzzy_targets[match.lastgroup]
+        
+        for keyword, ingredient in self._keywords:
             if keyword in detected_lower:
-                # Return the first valid ingredient from the list
-                for ing in ingredients:
-                    if ing in self.valid_ingredients:
-                        return ing
+                return ingredient
+        
+        for name, ingredient in self._partial:
+            if name in detected_lower or detected_lower in name:
+                return ingredient
         
-        # 5. Partial matching
-        for valid_ing in self.valid_ingredients:
-            if valid_ing.lower() in detected_lower or detected_lower in valid_ing.lower():
-                return valid_ing
+        # Embedded once per distinct label, thanks to the memo around this method
+        if self._embeddings is not None:
+            nearest = self._embeddings.nearest(detected_lower)
+            if nearest:
+                return self.registry.name(nearest[0])
+        
+        nearest = self._spelling.nearest(detected_lower)
+        if nearest:
+            return self.registry.name(nearest[0])
         
         return None
     
     def map_multiple(self, detected_objects: List[str]) -> List[str]:
         """Map multiple detected objects to ingredients"""
-        ingredients = []
-        for obj in detected_objects:
+        return self.map_with_confidence((obj, 1.0) for obj in detected_objects).ingredients
+    
+    def map_with_confidence(self, detections: Iterable[Tuple[str, float]]) -> DetectionResult:
+        """
+        Map (label, confidence) detections to ingredients.
+        
+        Several labels mapping to one ingredient keep the highest confidence.
+        """
+        result = DetectionResult()
+        for obj, confidence in detections:
             mapped = self.map_to_ingredient(obj)
-            if mapped and mapped not in ingredients:
-                ingredients.append(mapped)
+            if mapped:
+                result.add(mapped, confidence)
         
         # If no valid ingredients found, suggest common ones
-        if not ingredients:
+        if not result:
             # Return some common ingredients based on what's frequently used
             common_ingredients = ['Chicken', 'Tomato', 'Egg']
-            return [ing for ing in common_ingredients if ing in self.valid_ingredients][:2]
+            for ing in [ing for ing in common_ingredients if ing in self.valid_ingredients][:2]:
+                result.add(ing, FALLBACK_CONFIDENCE)
         
-        return ingredients
+        return result
     
     def enhance_detection(self, detected_objects: List[str], image_features: Dict = None) -> List[str]:
         """Enhance detection using additional image features"""
-        mapped_ingredients = self.map_multiple(detected_objects)
+        return self.enhance_with_confidence(
+            [(obj, 1.0) for obj in detected_objects], image_features
+        ).ingredients
+    
+    def enhance_with_confidence(self, detections: List[Tuple[str, float]],
+                                image_features: Dict = None) -> DetectionResult:
+        """Like enhance_detection, for (label, confidence) detections"""
+        result = self.map_with_confidence(detections)
         
         if image_features:
             # Add color-based detection
@@ -196,8 +330,8 @@ class IngredientMapper:
                 for color in image_features['dominant_colors']:
                     if color in self.keyword_mappings:
                         for ing in self.keyword_mappings[color]:
-                            if ing in self.valid_ingredients and ing not in mapped_ingredients:
-                                mapped_ingredients.append(ing)
+                            if ing in self.valid_ingredients and ing not in result.confidences:
+                                result.add(ing, HINT_CONFIDENCE)
                                 break
             
             # Add shape-based detection
@@ -205,8 +339,18 @@ class IngredientMapper:
                 for shape in image_features['shapes']:
                     if shape in self.keyword_mappings:
                         for ing in self.keyword_mappings[shape]:
-                            if ing in self.valid_ingredients and ing not in mapped_ingredients:
-                                mapped_ingredients.append(ing)
+                            if ing in self.valid_ingredients and ing not in result.confidences:
+                                result.add(ing, HINT_CONFIDENCE)
                                 break
         
-        return mapped_ingredients
\ No newline at end of file
+        return result
+
+# Singleton instance; its compiled tables and label memo are shared across requests
+_mapper = None
+
+def get_ingredient_mapper() -> IngredientMapper:
+    """Get or create the shared ingredient mapper"""
+    global _mapper
+    if _mapper is None:
+        _mapper = IngredientMapper()
+    return _mapper
\ No newline at end of file
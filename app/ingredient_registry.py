@@ -0,0 +1,162 @@
+"""
+Central ingredient vocabulary built from the recipe index columns
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Set
+
+from .recipe_index import get_recipe_index
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RECIPE_CSV = os.path.join(BASE_DIR, 'static/data/File_name.csv')
+
+# Extra names an ingredient is known by (matched case-insensitively)
+INGREDIENT_ALIASES = {
+    'Salad': ['lettuce', 'romaine', 'salad greens'],
+    'Oyster': ['oysters'],
+    'Crab': ['crabs'],
+    'Squid': ['calamari'],
+    'Shrimp': ['prawn', 'prawns', 'shrimps'],
+    'Lobster': ['lobsters'],
+    'Carrot': ['carrots'],
+    'Cabbage': ['cabbages'],
+    'Pumpkin': ['pumpkins'],
+    'Tomato': ['tomatoes'],
+    'Potato': ['potatoes'],
+    'Radish': ['radishes'],
+    'Cucumber': ['cucumbers'],
+    'Mushroom': ['mushrooms'],
+    'Egg': ['eggs'],
+    'Pork': ['bacon', 'ham'],
+    'Beef': ['steak'],
+    'Salmon': ['salmon fillet'],
+}
+
+# Categories used by dietary rules and allergies
+INGREDIENT_CATEGORIES = {
+    'Seafood': ['protein', 'seafood', 'mixed_seafood'],  # Unspecified, may hold shellfish
+    'Oyster': ['protein', 'seafood', 'shellfish'],
+    'Crab': ['protein', 'seafood', 'shellfish'],
+    'Salad': ['vegetable'],
+    'Squid': ['protein', 'seafood', 'mollusc'],
+    'Shrimp': ['protein', 'seafood', 'shellfish'],
+    'Lobster': ['protein', 'seafood', 'shellfish'],
+    'Carrot': ['vegetable'],
+    'Cabbage': ['vegetable'],
+    'Pumpkin': ['vegetable'],
+    'Squash': ['vegetable'],
+    'Tomato': ['vegetable'],
+    'Potato': ['vegetable'],
+    'Radish': ['vegetable'],
+    'Cucumber': ['vegetable'],
+    'Mushroom': ['vegetable'],
+    'Bread': ['grain', 'gluten'],
+    'Egg': ['protein', 'egg'],
+    'Pork': ['protein', 'meat', 'pork'],
+    'Beef': ['protein', 'meat'],
+    'Chicken': ['protein', 'meat', 'poultry'],
+    'Tuna': ['protein', 'seafood', 'fish'],
+    'Salmon': ['protein', 'seafood', 'fish'],
+}
+
+class Ingredient:
+    """One ingredient of the recipe index"""
+
+    def __init__(self, ingredient_id: int, name: str, aliases: List[str], categories: List[str]):
+        self.id = ingredient_id  # also the bit position in recipe masks
+        self.name = name
+        self.aliases = aliases
+        self.categories = categories
+
+    @property
+    def bit(self) -> int:
+        return 1 << self.id
+
+    def __repr__(self):
+        return f'<Ingredient {self.id} {self.name}>'
+
+class IngredientRegistry:
+    """
+    The ingredient vocabulary of the recipe index.
+
+    Ingredient ids are the recipe index column positions, so an id is also
+    the ingredient's bit in the recipe bitmasks. Names, aliases and
+    categories all resolve to ids; columns without an alias or category
+    entry still get an id and their own name.
+    """
+
+    def __init__(self, columns: Iterable[str], aliases: Dict[str, List[str]] = None,
+                 categories: Dict[str, List[str]] = None):
+        aliases = INGREDIENT_ALIASES if aliases is None else aliases
+        categories = INGREDIENT_CATEGORIES if categories is None else categories
+
+        self.ingredients = [
+            Ingredient(i, name, list(aliases.get(name, [])), list(categories.get(name, [])))
+            for i, name in enumerate(columns)
+        ]
+        self.names = [ingredient.name for ingredient in self.ingredients]
+
+        # Lowercase name or alias -> id; names win over aliases
+        self._lookup = {}
+        for ingredient in self.ingredients:
+            for alias in ingredient.aliases:
+                self._lookup.setdefault(alias.lower(), ingredient.id)
+        for ingredient in self.ingredients:
+            self._lookup[ingredient.name.lower()] = ingredient.id
+
+        self.categories = {}
+        for ingredient in self.ingredients:
+            for category in ingredient.categories:
+                self.categories.setdefault(category, []).append(ingredient.id)
+
+    def __len__(self):
+        return len(self.ingredients)
+
+    def __contains__(self, name: str) -> bool:
+        return self.resolve(name) is not None
+
+    def resolve(self, name: str) -> Optional[int]:
+        """Id for an ingredient name or alias (case-insensitive), or None"""
+        return self._lookup.get(name.lower().strip())
+
+    def name(self, ingredient_id: int) -> str:
+        return self.names[ingredient_id]
+
+    def resolve_terms(self, terms: Iterable[str]) -> Set[int]:
+        """Ids for a mix of category names and ingredient names (unknown terms ignored)"""
+        ids = set()
+        for term in terms:
+            if term in self.categories:
+                ids.update(self.categories[term])
+            else:
+                ingredient_id = self.resolve(term)
+                if ingredient_id is not None:
+                    ids.add(ingredient_id)
+        return ids
+
+    def mask_for_ids(self, ids: Iterable[int]) -> int:
+        """Recipe-mask bits for a set of ingredient ids"""
+        mask = 0
+        for ingredient_id in ids:
+            mask |= 1 << ingredient_id
+        return mask
+
+    def mask_for(self, names: Iterable[str]) -> int:
+        """Recipe-mask bits for ingredient names or aliases (unknown names ignored)"""
+        return self.mask_for_ids(
+            ingredient_id for ingredient_id in map(self.resolve, names) if ingredient_id is not None
+        )
+
+    def names_for_mask(self, mask: int) -> List[str]:
+        """Ingredient names whose bits are set in a recipe mask"""
+        return [ingredient.name for ingredient in self.ingredients if mask & ingredient.bit]
+
+_registries: Dict[str, IngredientRegistry] = {}
+
+def get_ingredient_registry(csv_path: str = DEFAULT_RECIPE_CSV) -> IngredientRegistry:
+    """Get the shared registry for a recipe CSV's ingredient columns"""
+    key = os.path.abspath(csv_path)
+    registry = _registries.get(key)
+    if registry is None:
+        registry = IngredientRegistry(get_recipe_index(csv_path).columns)
+        _registries[key] = registry
+    return registry
@@ -0,0 +1,125 @@
+"""
+Batched recipe interaction tracking for Pic2Kitchen
+"""
+import atexit
+import json
+import logging
+import threading
+from datetime import datetime
+from typing import List, Dict
+
+from sqlalchemy import insert
+
+from .database import db, RecipeHistory
+
+logger = logging.getLogger(__name__)
+
+def build_view_rows(user_id: int, recipe_ids: List, detected_ingredients: List[str],
+                    viewed_at: datetime) -> List[Dict]:
+    """Build RecipeHistory rows for a set of viewed recipes"""
+    ingredients_json = json.dumps(detected_ingredients)
+    return [
+        {
+            'user_id': user_id,
+            'recipe_id': str(recipe_id),
+            'viewed_at': viewed_at,
+            'detected_ingredients': ingredients_json
+        }
+        for recipe_id in recipe_ids
+    ]
+
+def insert_view_rows(rows: List[Dict]):
+    """Insert history rows with a single executemany (caller commits)"""
+    if rows:
+        db.session.execute(insert(RecipeHistory), rows)
+
+class InteractionTracker:
+    """
+    Records recipe views as bulk inserts.
+
+    With write-behind enabled, views are buffered in memory and flushed by a
+    background thread once the buffer reaches ``flush_size`` rows or
+    ``flush_interval`` seconds have passed, so requests never wait on
+    history writes. When an ``event_log`` is given, views are appended to
+    the durable log instead and applied by its consumer.
+    """
+
+    def __init__(self, app, write_behind: bool = False, flush_size: int = 100,
+                 flush_interval: float = 5.0, event_log=None):
+        self.app = app
+        self.event_log = event_log
+        self.write_behind = write_behind
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._worker = None
+
+        if self.write_behind:
+            self._worker = threading.Thread(
+                target=self._run, name='interaction-tracker', daemon=True
+            )
+            self._worker.start()
+            atexit.register(self.close)
+
+    def record_views(self, user_id: int, recipe_ids: List, detected_ingredients: List[str]):
+        """Record that a user was shown a set of recipes"""
+        if not recipe_ids:
+            return
+
+        if self.event_log is not None:
+            self.event_log.append('view', {
+                'user_id': user_id,
+                'recipe_ids': [str(recipe_id) for recipe_id in recipe_ids],
+                'detected_ingredients': detected_ingredients
+            })
+            return
+
+        rows = build_view_rows(user_id, recipe_ids, detected_ingredients, datetime.utcnow())
+
+        if not self.write_behind:
+            self._write(rows)
+            return
+
+        with self._lock:
+            self._buffer.extend(rows)
+            buffered = len(self._buffer)
+
+        if buffered >= self.flush_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """Write all buffered views to the database"""
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+
+        if rows:
+            with self.app.app_context():
+                self._write(rows)
+
+    def close(self):
+        """Stop the background worker and flush what is left"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._worker is not None and self._worker.is_alive():
+            self._worker.join(timeout=self.flush_interval + 1)
+        self.flush()
+
+    def _write(self, rows: List[Dict]):
+        """Insert history rows and commit once"""
+        try:
+            insert_view_rows(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.warning("Failed to record %d recipe views: %s", len(rows), e)
+
+    def _run(self):
+        """Background loop flushing on size or time thresholds"""
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
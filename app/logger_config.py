@@ -1,40 +1,103 @@
 """
 Logging configuration for Pic2Kitchen application
 """
+import atexit
+import json
 import logging
 import os
+import queue
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 
-def setup_logger(name, log_file=None, level=logging.INFO):
-    """Setup a logger with file and console handlers"""
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any ``extra={...}`` fields"""
+    
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """QueueHandler that leaves message formatting to the listener thread"""
+    
+    def prepare(self, record):
+        # The queue never leaves the process, so the record can go as is
+        return record
+
+def _build_formatter(log_format):
+    if log_format == 'json':
+        return JsonFormatter()
+    return logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+def setup_logger(name, log_file=None, level=logging.INFO, log_format='text'):
+    """
+    Setup a logger with file and console handlers.
+    
+    The handlers run on a QueueListener thread; the logger itself only
+    holds a QueueHandler, so logging from a request thread never waits on
+    formatting or stdout/file I/O. Records below ``level`` are dropped
+    before any message formatting happens.
+    """
     
     # Create logger
     logger = logging.getLogger(name)
     logger.setLevel(level)
+    logger.propagate = False
     
     # Create formatters
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    formatter = _build_formatter(log_format)
     
     # Console handler
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
+    console_handler.setLevel(level)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # File handler (optional)
     if log_file:
-        # Create logs directory if it doesn't exist
-        log_dir = os.path.dirname(log_file)
-        if log_dir and not os.path.exists(log_dir):
-            os.makedirs(log_dir)
+        try:
+            # Create logs directory if it doesn't exist
+            log_dir = os.path.dirname(log_file)
+            if log_dir and not os.path.exists(log_dir):
+                os.makedirs(log_dir)
             
-        file_handler = logging.FileHandler(log_file)
-        file_handler.setLevel(logging.DEBUG)
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+            file_handler = logging.FileHandler(log_file)
+            file_handler.setLevel(logging.DEBUG)
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        except OSError as e:
+            console_handler.handle(logging.makeLogRecord({
+                'name': name, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"Logging to console only, cannot open {log_file}: {e}"
+            }))
+    
+    # Hand records to a background thread for formatting and I/O
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(DeferredQueueHandler(log_queue))
     
     return logger
 
-# Create application-wide logger
-app_logger = setup_logger('pic2kitchen', 
-                         log_file=f'logs/pic2kitchen_{datetime.now().strftime("%Y%m%d")}.log')
\ No newline at end of file
+# Create application-wide logger; the app package's module loggers
+# (logging.getLogger(__name__)) are its children and share its queue
+app_logger = setup_logger(__package__ or 'app',
+                         log_file=f'logs/pic2kitchen_{datetime.now().strftime("%Y%m%d")}.log',
+                         level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                         log_format=os.environ.get('LOG_FORMAT', 'text').lower())
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""
+Database maintenance jobs for Pic2Kitchen
+"""
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, case, insert
+
+from .database import (
+    db, upsert_insert, RecipeHistory, RecipeViewSummary, RecipeFavorite,
+    RecipeRating, RecipeStats, UserPreference
+)
+
+logger = logging.getLogger(__name__)
+
+def compact_recipe_history(retention_days: int = 30) -> int:
+    """
+    Roll history rows older than ``retention_days`` into per-recipe counters.
+    
+    Old views no longer affect scoring, so they are folded into
+    RecipeViewSummary (view and cook counts, first/last timestamps) and
+    deleted. The latest view of each user and recipe is kept, so a recipe
+    viewed long ago can still be marked cooked. That keeps recipe_history
+    bounded by the retention window plus one row per user and recipe.
+    Returns the number of history rows compacted.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    
+    # Pin the batch to rows that exist now so concurrent inserts are untouched
+    max_id = db.session.query(func.max(RecipeHistory.id)).filter(
+        RecipeHistory.viewed_at < cutoff
+    ).scalar()
+    if max_id is None:
+        return 0
+    
+    latest_views = db.session.query(func.max(RecipeHistory.id)).group_by(
+        RecipeHistory.user_id, RecipeHistory.recipe_id
+    )
+    in_batch = (
+        RecipeHistory.id <= max_id,
+        RecipeHistory.viewed_at < cutoff,
+        RecipeHistory.id.notin_(latest_views.scalar_subquery())
+    )
+    rollups = db.session.query(
+        RecipeHistory.user_id,
+        RecipeHistory.recipe_id,
+        func.count(RecipeHistory.id),
+        func.count(RecipeHistory.cooked_at),
+        func.min(RecipeHistory.viewed_at),
+        func.max(RecipeHistory.viewed_at),
+        func.max(RecipeHistory.cooked_at)
+    ).filter(*in_batch).group_by(RecipeHistory.user_id, RecipeHistory.recipe_id).all()
+    
+    try:
+        for user_id, recipe_id, views, cooks, first_viewed, last_viewed, last_cooked in rollups:
+            _merge_summary(user_id, recipe_id, views, cooks, first_viewed, last_viewed, last_cooked)
+        
+        compacted = RecipeHistory.query.filter(*in_batch).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    logger.info("Compacted %d recipe history rows into %d summaries", compacted, len(rollups))
+    return compacted
+
+def _merge_summary(user_id, recipe_id, views, cooks, first_viewed, last_viewed, last_cooked):
+    """Add rolled-up counts to a user's summary row for one recipe"""
+    stmt = upsert_insert(RecipeViewSummary)
+    if stmt is not None:
+        stmt = stmt.values(
+            user_id=user_id, recipe_id=recipe_id,
+            view_count=views, cooked_count=cooks,
+            first_viewed_at=first_viewed, last_viewed_at=last_viewed,
+            last_cooked_at=last_cooked
+        )
+        table = RecipeViewSummary.__table__
+        new = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'recipe_id'],
+            set_={
+                'view_count': table.c.view_count + new.view_count,
+                'cooked_count': table.c.cooked_count + new.cooked_count,
+                'first_viewed_at': _earliest(table.c.first_viewed_at, new.first_viewed_at),
+                'last_viewed_at': _latest(table.c.last_viewed_at, new.last_viewed_at),
+                'last_cooked_at': _latest(table.c.last_cooked_at, new.last_cooked_at)
+            }
+        )
+        db.session.execute(stmt)
+        return
+    
+    summary = RecipeViewSummary.query.filter_by(user_id=user_id, recipe_id=recipe_id).first()
+    if summary is None:
+        summary = RecipeViewSummary(
+            user_id=user_id, recipe_id=recipe_id, view_count=0, cooked_count=0,
+            first_viewed_at=first_viewed
+        )
+        db.session.add(summary)
+    summary.view_count += views
+    summary.cooked_count += cooks
+    summary.first_viewed_at = min(filter(None, [summary.first_viewed_at, first_viewed]), default=None)
+    summary.last_viewed_at = max(filter(None, [summary.last_viewed_at, last_viewed]), default=None)
+    summary.last_cooked_at = max(filter(None, [summary.last_cooked_at, last_cooked]), default=None)
+
+def _earliest(current, new):
+    """Portable LEAST() that ignores NULLs"""
+    return case((current.is_(None), new), (new < current, new), else_=current)
+
+def _latest(current, new):
+    """Portable GREATEST() that ignores NULLs"""
+    return case((current.is_(None), new), (new > current, new), else_=current)
+
+def rebuild_recipe_stats() -> int:
+    """
+    Recompute every RecipeStats row from the source tables.
+    
+    The aggregates are maintained incrementally by the write paths; this
+    backfills them for existing data or repairs drift. Returns the number
+    of recipes with stats.
+    """
+    stats = {}
+    
+    def entry(recipe_id):
+        return stats.setdefault(recipe_id, {
+            'rating_count': 0, 'rating_sum': 0, 'favorite_count': 0, 'cooked_count': 0
+        })
+    
+    for recipe_id, count, total in db.session.query(
+        RecipeRating.recipe_id, func.count(RecipeRating.id), func.sum(RecipeRating.rating)
+    ).group_by(RecipeRating.recipe_id):
+        entry(recipe_id).update(rating_count=count, rating_sum=total or 0)
+    
+    for recipe_id, count in db.session.query(
+        RecipeFavorite.recipe_id, func.count(RecipeFavorite.id)
+    ).group_by(RecipeFavorite.recipe_id):
+        entry(recipe_id)['favorite_count'] = count
+    
+    for recipe_id, count in db.session.query(
+        RecipeHistory.recipe_id, func.count(RecipeHistory.id)
+    ).filter(RecipeHistory.cooked.is_(True)).group_by(RecipeHistory.recipe_id):
+        entry(recipe_id)['cooked_count'] += count
+    
+    # Cooks already rolled up by compact_recipe_history
+    for recipe_id, count in db.session.query(
+        RecipeViewSummary.recipe_id, func.sum(RecipeViewSummary.cooked_count)
+    ).group_by(RecipeViewSummary.recipe_id):
+        entry(recipe_id)['cooked_count'] += count or 0
+    
+    try:
+        RecipeStats.query.delete(synchronize_session=False)
+        if stats:
+            db.session.execute(insert(RecipeStats), [
+                dict(recipe_id=recipe_id, updated_at=datetime.utcnow(), **values)
+                for recipe_id, values in stats.items()
+            ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return len(stats)
+
+def hot_queries():
+    """The per-request lookups that must be served by an index"""
+    since = datetime.utcnow() - timedelta(days=14)
+    return {
+        'favorites_by_user': db.session.query(RecipeFavorite.recipe_id).filter(
+            RecipeFavorite.user_id == 1
+        ),
+        'favorite_by_user_recipe': RecipeFavorite.query.filter_by(user_id=1, recipe_id='1'),
+        'ratings_by_user': db.session.query(RecipeRating.recipe_id, RecipeRating.rating).filter(
+            RecipeRating.user_id == 1
+        ),
+        'rating_avg_by_recipe': db.session.query(func.avg(RecipeRating.rating)).filter(
+            RecipeRating.recipe_id == '1'
+        ),
+        'preferences_by_user': UserPreference.query.filter_by(user_id=1),
+        'preference_by_user_ingredient': UserPreference.query.filter_by(
+            user_id=1, ingredient='Chicken'
+        ),
+        'history_window_by_user': db.session.query(
+            RecipeHistory.recipe_id, func.max(RecipeHistory.viewed_at)
+        ).filter(
+            RecipeHistory.user_id == 1, RecipeHistory.viewed_at >= since
+        ).group_by(RecipeHistory.recipe_id),
+        'history_latest_view': RecipeHistory.query.filter_by(
+            user_id=1, recipe_id='1'
+        ).order_by(RecipeHistory.viewed_at.desc()).limit(1),
+    }
+
+def explain_hot_queries():
+    """
+    Run EXPLAIN on each hot query and report whether it uses an index.
+    
+    Returns {name: (uses_index, plan_text)}. On PostgreSQL sequential scans
+    are disabled for the check, so small tables still show whether a usable
+    index exists rather than the planner's small-table preference.
+    """
+    connection = db.session.connection()
+    dialect = connection.dialect
+    results = {}
+    
+    if dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    
+    for name, query in hot_queries().items():
+        compiled = query.statement.compile(dialect=dialect)
+        if dialect.name == 'sqlite':
+            params = tuple(compiled.params[key] for key in compiled.positiontup)
+            rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params)
+            steps = [row[-1] for row in rows]
+            plan = '\n'.join(steps)
+            # A bare "SCAN <table>" step is a full table scan
+            uses_index = 'INDEX' in plan and not any(
+                step.startswith('SCAN') and 'INDEX' not in step for step in steps
+            )
+        else:
+            rows = connection.exec_driver_sql('EXPLAIN ' + str(compiled), compiled.params)
+            plan = '\n'.join(row[0] for row in rows)
+            uses_index = 'Index' in plan
+        results[name] = (uses_index, plan)
+    
+    db.session.rollback()
+    return results
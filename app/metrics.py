@@ -0,0 +1,180 @@
+"""
+Per-stage request timing and counters, exported as Prometheus text
+"""
+import threading
+import time
+from typing import Dict, Tuple
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _NullTimer:
+    """Stand-in timer used while metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+class StageTimer:
+    """Times one stage of the current request"""
+
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics: 'Metrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    """
+    Stage timers and counters for the request path.
+
+    Disabled (the default), ``timer()`` returns a shared no-op context
+    manager and ``count()`` returns straight away, so instrumented code
+    pays one attribute check. Enabled, each stage lands in a duration
+    histogram per endpoint and in the response's ``Server-Timing`` header.
+    Cache hit rates are read from registered LRUCaches at scrape time.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple, float] = {}  # (name, labels) -> value
+        self._histograms: Dict[Tuple[str, str], list] = {}  # (endpoint, stage) -> bucket counts + [sum, count]
+        self._caches = {}  # name -> LRUCache
+
+    def init_app(self, app):
+        """Enable from METRICS_ENABLED and hook request timing into the app"""
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        if not self.enabled:
+            return
+
+        @app.before_request
+        def start_request_timer():
+            g.request_started = time.perf_counter()
+            g.server_timing = {}  # stage -> seconds, summed over repeats
+            g.db_queries = 0
+
+        @app.after_request
+        def record_request(response):
+            started = g.get('request_started')
+            if started is None:
+                return response
+            endpoint = request.endpoint or 'unknown'
+            total = time.perf_counter() - started
+            self.observe('total', total)
+            self.count('http_requests', endpoint=endpoint, status=str(response.status_code))
+
+            timings = [f'{stage};dur={seconds * 1000:.1f}' for stage, seconds in g.server_timing.items()]
+            timings.append(f'sql;desc="{g.db_queries} queries"')
+            timings.append(f'total;dur={total * 1000:.1f}')
+            response.headers['Server-Timing'] = ', '.join(timings)
+            return response
+
+    def instrument_engine(self, engine):
+        """Count the SQL statements an engine executes (only while enabled)"""
+        if not self.enabled:
+            return
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count_query(*args):
+            self.count('db_queries')
+            if has_request_context() and 'db_queries' in g:
+                g.db_queries += 1
+
+    def register_cache(self, name: str, cache):
+        """Export an LRUCache's hit and miss counts"""
+        self._caches[name] = cache
+
+    def timer(self, stage: str):
+        """Context manager timing a stage of the current request"""
+        if not self.enabled:
+            return NULL_TIMER
+        return StageTimer(self, stage)
+
+    def count(self, name: str, value: float = 1, **labels):
+        """Add to a counter, e.g. ``count('model_invocations', model='yolo')``"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, stage: str, seconds: float):
+        """Record a stage duration for the current endpoint"""
+        in_request = has_request_context()
+        endpoint = (request.endpoint if in_request else None) or 'none'
+        key = (endpoint, stage)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(DURATION_BUCKETS) + 2)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+        if in_request and stage != 'total' and 'server_timing' in g:
+            g.server_timing[stage] = g.server_timing.get(stage, 0.0) + seconds
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f'# TYPE kitchenking_{name}_total counter')
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f'kitchenking_{name}_total{_labels(labels)} {value:g}')
+
+        if histograms:
+            lines.append('# TYPE kitchenking_stage_duration_seconds histogram')
+        for (endpoint, stage), values in sorted(histograms.items()):
+            labels = (('endpoint', endpoint), ('stage', stage))
+            cumulative = 0
+            for bound, bucket in zip(DURATION_BUCKETS, values):
+                cumulative += bucket
+                lines.append(f'kitchenking_stage_duration_seconds_bucket'
+                             f'{_labels(labels + (("le", f"{bound:g}"),))} {cumulative}')
+            lines.append(f'kitchenking_stage_duration_seconds_bucket{_labels(labels + (("le", "+Inf"),))} {values[-1]}')
+            lines.append(f'kitchenking_stage_duration_seconds_sum{_labels(labels)} {values[-2]:.6f}')
+            lines.append(f'kitchenking_stage_duration_seconds_count{_labels(labels)} {values[-1]}')
+
+        if self._caches:
+            lines.append('# TYPE kitchenking_cache_hits_total counter')
+            lines.extend(f'kitchenking_cache_hits_total{{cache="{name}"}} {cache.hits}'
+                         for name, cache in sorted(self._caches.items()))
+            lines.append('# TYPE kitchenking_cache_misses_total counter')
+            lines.extend(f'kitchenking_cache_misses_total{{cache="{name}"}} {cache.misses}'
+                         for name, cache in sorted(self._caches.items()))
+        return '\n'.join(lines) + '\n'
+
+    def response(self) -> Response:
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+def _labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+# Shared by the app and the modules it instruments
+metrics = Metrics()
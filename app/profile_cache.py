@@ -0,0 +1,144 @@
+"""
+In-process cache of per-user recommendation profiles
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+class LRUCache:
+    """Thread-safe bounded LRU cache whose entries expire after ``ttl`` seconds"""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def update(self, key, func: Callable):
+        """Apply ``func`` to a cached value in place, if it is cached"""
+        with self._lock:
+            value = self.get(key)
+            if value is not None:
+                func(value)
+
+    def invalidate(self, key):
+        """Drop a single entry"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class UserProfile:
+    """Everything personalized scoring needs to know about one user"""
+
+    def __init__(self, preferences: Dict[str, float], interaction_counts: Dict[str, int],
+                 history: Dict[str, datetime], favorites: Set[str], ratings: Dict[str, int]):
+        self.preferences = preferences  # ingredient -> preference score (0-1)
+        self.interaction_counts = interaction_counts  # ingredient -> interaction count
+        self.history = history  # recipe_id -> latest view time
+        self.favorites = favorites  # recipe_ids
+        self.ratings = ratings  # recipe_id -> rating (1-5)
+
+    def apply_preference_update(self, ingredients: Iterable[str], learning_rate: float,
+                                min_interactions: int):
+        """Mirror PersonalizedRecommender's preference learning rule"""
+        for ingredient in dict.fromkeys(ingredients):
+            if ingredient not in self.preferences:
+                self.preferences[ingredient] = 0.6
+                self.interaction_counts[ingredient] = 1
+                continue
+
+            count = self.interaction_counts.get(ingredient, 0) + 1
+            self.interaction_counts[ingredient] = count
+            if count >= min_interactions:
+                score = self.preferences[ingredient]
+                self.preferences[ingredient] = min(1.0, score + learning_rate * (1 - score))
+
+    def note_views(self, recipe_ids: List, viewed_at: datetime):
+        """Record freshly viewed recipes in the history map"""
+        for recipe_id in recipe_ids:
+            self.history[str(recipe_id)] = viewed_at
+
+    def days_since_viewed(self, recipe_id, now: Optional[datetime] = None) -> Optional[int]:
+        """Days since the recipe was last viewed, or None if never viewed"""
+        viewed_at = self.history.get(str(recipe_id))
+        if viewed_at is None:
+            return None
+        return ((now or datetime.utcnow()) - viewed_at).days
+
+class InventoryProfile:
+    """
+    A user's stocked ingredients, resolved to ingredient registry ids.
+
+    Stock is evaluated per day and memoized, so repeated requests on the
+    same day reuse the stocked ids and their recipe-mask bits.
+    """
+
+    def __init__(self, expiry_dates: Dict[int, List[Optional[date]]]):
+        self.expiry_dates = expiry_dates  # ingredient id -> expiry date of each item (None if unknown)
+        self._day = None
+        self._stocked: Dict[int, Optional[int]] = {}
+        self._mask = 0
+
+    def in_stock(self, today: date) -> Dict[int, Optional[int]]:
+        """
+        Ingredient id -> days until expiry (None if unknown), skipping expired items.
+
+        With several items of one ingredient, expired ones are ignored and
+        the soonest remaining expiry counts, so old stock never hides fresh stock.
+        """
+        if self._day != today:
+            stocked = {}
+            for ingredient, expiry_dates in self.expiry_dates.items():
+                remaining = [(d - today).days for d in expiry_dates if d is not None and d >= today]
+                if remaining:
+                    stocked[ingredient] = min(remaining)
+                elif None in expiry_dates:
+                    stocked[ingredient] = None
+
+            mask = 0
+            for ingredient in stocked:
+                mask |= 1 << ingredient  # ids are recipe-mask bit positions
+            self._stocked, self._mask, self._day = stocked, mask, today
+        return self._stocked
+
+    def stocked_mask(self, today: date) -> int:
+        """Recipe-mask bits of the ingredients in stock on ``today``"""
+        self.in_stock(today)
+        return self._mask
@@ -0,0 +1,181 @@
+"""
+Opt-in stack-sampling profiler for a fraction of production requests
+"""
+import atexit
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# Requests eligible for sampling: (endpoint, method)
+PROFILED_REQUESTS = {('kitchen', 'GET'), ('index', 'POST')}
+
+class SamplingProfiler:
+    """
+    Wall-clock stack sampler for selected requests.
+
+    A sampled request registers its thread; while any is registered, a
+    background thread records that thread's Python stack every
+    ``interval`` seconds. Stacks are aggregated per endpoint in the folded
+    format (``outer;inner;leaf count``) that flamegraph.pl, speedscope and
+    inferno read directly, and written to ``<output_dir>/<endpoint>.<pid>.folded``
+    (one file per worker process; concatenate them to merge workers).
+    Requests that are not sampled only pay a random() call.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, interval: float = 0.005,
+                 output_dir: str = 'profiles', flush_interval: float = 30.0):
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.output_dir = output_dir
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._active: Dict[int, str] = {}  # thread id -> endpoint being profiled
+        self._wake = threading.Event()
+        self._stacks: Dict[str, Counter] = {}  # endpoint -> folded stack -> samples
+        self._requests: Counter = Counter()  # endpoint -> profiled requests
+        self._dirty = False
+        self._thread: Optional[threading.Thread] = None
+
+    def init_app(self, app):
+        """Enable from PROFILER_* settings and hook sampling into the app"""
+        self.enabled = app.config.get('PROFILER_ENABLED', False)
+        if not self.enabled:
+            return
+        self.sample_rate = app.config.get('PROFILER_SAMPLE_RATE', self.sample_rate)
+        self.interval = app.config.get('PROFILER_INTERVAL', self.interval)
+        self.output_dir = app.config.get('PROFILER_DIR', self.output_dir)
+        atexit.register(self._flush_quietly)
+
+        @app.before_request
+        def start_sampling():
+            if (request.endpoint, request.method) in PROFILED_REQUESTS and random.random() < self.sample_rate:
+                g.profiled = True
+                self.begin(request.endpoint)
+
+        @app.teardown_request
+        def stop_sampling(exception=None):
+            if g.pop('profiled', False):
+                self.end()
+
+    def begin(self, endpoint: str):
+        """Start sampling the calling thread"""
+        with self._lock:
+            self._active[threading.get_ident()] = endpoint
+            self._requests[endpoint] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end(self):
+        """Stop sampling the calling thread"""
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            # Cleared before the check, so a begin() in between still wakes the wait
+            self._wake.clear()
+            if not self._active:
+                # Flush while idle so request threads never wait on file writes
+                if self._dirty and time.monotonic() - last_flush >= self.flush_interval:
+                    self._flush_quietly()
+                    last_flush = time.monotonic()
+                self._wake.wait(self.flush_interval)
+                continue
+
+            self._sample()
+            time.sleep(self.interval)
+
+    def _sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for thread_id, endpoint in self._active.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}")
+                    frame = frame.f_back
+                self._stacks.setdefault(endpoint, Counter())[';'.join(reversed(stack))] += 1
+            self._dirty = True
+
+    def folded(self, endpoint: str = None) -> str:
+        """Aggregated stacks in folded format, for one endpoint or all of them"""
+        with self._lock:
+            stacks = Counter()
+            for name, counts in self._stacks.items():
+                if endpoint is None or name == endpoint:
+                    stacks.update(counts)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+    def top_functions(self, limit: int = 25, endpoint: str = None) -> Dict:
+        """Functions by samples spent in them (self) and under them (total)"""
+        with self._lock:
+            stacks = Counter()
+            for name, counts in self._stacks.items():
+                if endpoint is None or name == endpoint:
+                    stacks.update(counts)
+            requests = dict(self._requests)
+
+        own, total = Counter(), Counter()
+        for stack, count in stacks.items():
+            functions = stack.split(';')
+            own[functions[-1]] += count
+            for function in set(functions):
+                total[function] += count
+
+        samples = sum(stacks.values())
+        functions: List[Dict] = [
+            {
+                'function': function,
+                'self_samples': own[function],
+                'self_percent': round(100.0 * own[function] / samples, 2),
+                'total_samples': total[function],
+                'total_percent': round(100.0 * total[function] / samples, 2)
+            }
+            for function, _ in own.most_common(limit)
+        ]
+        return {
+            'requests_profiled': requests,
+            'samples': samples,
+            'interval_ms': self.interval * 1000,
+            'top_functions': functions
+        }
+
+    def flush(self):
+        """Write one folded-stack file per endpoint (atomically replaced)"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        with self._lock:
+            endpoints = list(self._stacks)
+            self._dirty = False
+        for endpoint in endpoints:
+            path = os.path.join(self.output_dir, f'{endpoint}.{os.getpid()}.folded')
+            tmp_path = f'{path}.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(self.folded(endpoint))
+            os.replace(tmp_path, path)
+
+    def _flush_quietly(self):
+        if not self._dirty:
+            return
+        try:
+            self.flush()
+        except OSError as e:
+            logger.warning("Could not write profiles to %s: %s", self.output_dir, e)
+
+# Shared by the app and its admin endpoint
+profiler = SamplingProfiler()
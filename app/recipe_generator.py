@@ -2,9 +2,11 @@
 Recipe generator to create JSON recipe files based on ingredient combinations from CSV
 """
 import json
-import pandas as pd
 from pathlib import Path
 
+from .ingredient_registry import BASE_DIR, DEFAULT_RECIPE_CSV, get_ingredient_registry
+from .recipe_index import get_recipe_index
+
 class RecipeGenerator:
     def __init__(self):
         # Recipe templates based on common ingredient combinations
@@ -267,31 +269,24 @@ class RecipeGenerator:
 
 def generate_all_recipes():
     """Generate recipe JSON files for all entries in the CSV"""
-    # Read the CSV file (tab-separated)
-    df = pd.read_csv('/home/athar/Pic2kitchen-master/app/static/data/File_name.csv', sep='\t')
+    # Recipe ids and ingredient bitmasks from the compiled recipe index
+    index_data = get_recipe_index(DEFAULT_RECIPE_CSV)
+    registry = get_ingredient_registry(DEFAULT_RECIPE_CSV)
     
     # Initialize recipe generator
     generator = RecipeGenerator()
     
-    # Get all ingredient columns
-    ingredient_columns = [
-        'Seafood', 'Oyster', 'Crab', 'Salad', 'Squid', 'Shrimp', 'Lobster',
-        'Carrot', 'Cabbage', 'Pumpkin', 'Squash', 'Tomato', 'Potato', 'Radish',
-        'Cucumber', 'Mushroom', 'Bread', 'Egg', 'Pork', 'Beef', 'Chicken',
-        'Tuna', 'Salmon'
-    ]
-    
     # Create output directory
-    output_dir = Path('/home/athar/Pic2kitchen-master/app/static/data/Food_recipe')
+    output_dir = Path(BASE_DIR) / 'static/data/Food_recipe'
     output_dir.mkdir(parents=True, exist_ok=True)
     
     # Generate recipes for each row
-    for idx, row in df.iterrows():
+    for idx, (recipe_id, mask) in enumerate(zip(index_data.ids, index_data.masks)):
         # Get ingredients for this recipe
-        ingredients = [col for col in ingredient_columns if row[col] == True]
+        ingredients = registry.names_for_mask(int(mask))
         
         if ingredients:  # Only create recipe if there are ingredients
-            index = int(row['IndexFile'])
+            index = int(recipe_id)
             recipe = generator.generate_recipe(index, ingredients)
             
             # Write to JSON file
@@ -0,0 +1,194 @@
+"""
+Compact, memory-mappable recipe index compiled from File_name.csv
+"""
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Non-ingredient columns of File_name.csv
+META_COLUMNS = ['Unnamed: 0.1', 'Unnamed: 0', 'FileName', 'IndexFile']
+
+# One record per recipe: IndexFile and a bitmask with bit i = columns[i]
+RECORD_DTYPE = np.dtype([('id', '<i4'), ('mask', '<u4')])
+
+# Bits set per byte value, for popcounts over uint32 masks
+_BYTE_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    """Number of set bits in each uint32 mask"""
+    masks = masks.astype(np.uint32, copy=False)
+    return (_BYTE_POPCOUNT[masks & 0xFF].astype(np.int32)
+            + _BYTE_POPCOUNT[(masks >> 8) & 0xFF]
+            + _BYTE_POPCOUNT[(masks >> 16) & 0xFF]
+            + _BYTE_POPCOUNT[masks >> 24])
+
+def compiled_paths(csv_path: str):
+    """Paths of the compiled records and their metadata for a CSV file"""
+    base = os.path.splitext(csv_path)[0]
+    return base + '.index.npy', base + '.index.json'
+
+class RecipeIndex:
+    """
+    Recipe ids and packed ingredient bitmasks.
+
+    The CSV holds one bool column per ingredient; compiled, a recipe is
+    eight bytes. The records are stored as ``<csv>.index.npy`` next to the
+    CSV (with column names in ``<csv>.index.json``) and memory-mapped on
+    load, so startup skips CSV parsing entirely.
+    """
+
+    def __init__(self, columns: List[str], records: np.ndarray):
+        self.columns = list(columns)
+        self.records = records
+        self.ids = records['id']
+        self.masks = records['mask']
+        self.bits = {column: 1 << i for i, column in enumerate(self.columns)}
+
+        # Signature index: the distinct masks (about 1.2k for 21k recipes)
+        # and, per row, which of them it has; superset tests run per signature
+        self.signatures, self.signature_rows = np.unique(self.masks, return_inverse=True)
+        self._frame = None
+        self._frame_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def from_csv(cls, csv_path: str) -> 'RecipeIndex':
+        """Parse File_name.csv into an index"""
+        df = pd.read_csv(csv_path, sep='\t')
+        columns = [col for col in df.columns
+                   if col not in META_COLUMNS and df[col].dtype == bool]
+        if len(columns) > 32:
+            raise ValueError(f"{len(columns)} ingredient columns do not fit a 32-bit mask")
+
+        matrix = df[columns].to_numpy(dtype=bool)
+        bit_values = np.left_shift(np.uint32(1), np.arange(len(columns), dtype=np.uint32))
+
+        records = np.empty(len(df), dtype=RECORD_DTYPE)
+        records['id'] = df['IndexFile'].astype(int).to_numpy()
+        records['mask'] = (matrix * bit_values).sum(axis=1)
+        return cls(columns, records)
+
+    @classmethod
+    def load(cls, csv_path: str) -> Optional['RecipeIndex']:
+        """Memory-map the compiled index, or None if missing or older than the CSV"""
+        records_path, meta_path = compiled_paths(csv_path)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            stat = os.stat(csv_path)
+            if meta.get('source_size') != stat.st_size or meta.get('source_mtime') != stat.st_mtime:
+                return None
+            records = np.load(records_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+        if records.dtype != RECORD_DTYPE or len(records) != meta.get('count'):
+            return None
+        return cls(meta['columns'], records)
+
+    def save(self, csv_path: str):
+        """Write the compiled index next to the CSV it was built from"""
+        records_path, meta_path = compiled_paths(csv_path)
+        stat = os.stat(csv_path)
+        meta = {
+            'columns': self.columns,
+            'count': len(self.records),
+            'source_size': stat.st_size,
+            'source_mtime': stat.st_mtime
+        }
+
+        # Write then rename so concurrent workers never map a partial file
+        tmp_records = f'{records_path}.{os.getpid()}.tmp'
+        with open(tmp_records, 'wb') as f:
+            np.save(f, np.ascontiguousarray(self.records))
+        os.replace(tmp_records, records_path)
+
+        tmp_meta = f'{meta_path}.{os.getpid()}.tmp'
+        with open(tmp_meta, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, meta_path)
+
+    def rows_matching_prefix(self, ingredients: List[str]) -> np.ndarray:
+        """
+        Rows of recipes using the longest matchable prefix of ``ingredients``.
+
+        Finds the largest ``k`` such that some recipe uses all of
+        ``ingredients[:k]`` and returns every such recipe in file order, in a
+        single pass over the signatures. Unknown names match no recipe.
+        Returns an empty array when no recipe uses the first ingredient.
+        """
+        # Longest prefix contained in each signature
+        prefix_lengths = np.zeros(len(self.signatures), dtype=np.int32)
+        still_matching = np.ones(len(self.signatures), dtype=bool)
+        prefix_mask = 0
+        for k, ingredient in enumerate(ingredients, start=1):
+            bit = self.bits.get(ingredient)
+            if bit is None:
+                break
+            prefix_mask |= bit
+            still_matching &= (self.signatures & np.uint32(prefix_mask)) == prefix_mask
+            if not still_matching.any():
+                break
+            prefix_lengths[still_matching] = k
+
+        best = prefix_lengths.max() if len(prefix_lengths) else 0
+        if best == 0:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero((prefix_lengths == best)[self.signature_rows])
+
+    def frame(self) -> pd.DataFrame:
+        """
+        The index as a DataFrame of bool ingredient columns plus IndexFile.
+
+        Built on first use only, for callers that still query with pandas.
+        """
+        with self._frame_lock:
+            if self._frame is None:
+                data = {column: (self.masks & np.uint32(bit)) != 0
+                        for column, bit in self.bits.items()}
+                data['IndexFile'] = np.asarray(self.ids)
+                self._frame = pd.DataFrame(data)
+            return self._frame
+
+_indexes: Dict[str, RecipeIndex] = {}
+_indexes_lock = threading.Lock()
+
+def build_recipe_index(csv_path: str) -> RecipeIndex:
+    """Compile the CSV and write the index files"""
+    index = RecipeIndex.from_csv(csv_path)
+    index.save(csv_path)
+    return index
+
+def get_recipe_index(csv_path: str) -> RecipeIndex:
+    """
+    Get the process-wide index for a recipe CSV.
+
+    Loads the compiled index when it is up to date, otherwise compiles the
+    CSV (and saves the result when the data directory is writable).
+    """
+    key = os.path.abspath(csv_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            return index
+
+        index = RecipeIndex.load(csv_path)
+        if index is None:
+            index = RecipeIndex.from_csv(csv_path)
+            try:
+                index.save(csv_path)
+                logger.info("Compiled recipe index for %s", csv_path)
+            except OSError as e:
+                logger.warning("Could not save compiled recipe index: %s", e)
+
+        _indexes[key] = index
+        return index
@@ -1,9 +1,40 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 import json
 import os
 
+from .recipe_index import get_recipe_index, popcount
+from .ingredient_registry import get_ingredient_registry
+
+def recipe_key(recipe_id) -> int:
+    """
+    Canonical recipe id: the integer IndexFile value.
+    
+    Recipe ids arrive as ints from the recommender and as strings such as
+    "33" or "00033" from URLs and the database; all map to the same key.
+    """
+    return int(recipe_id)
+
+class IngredientQuery:
+    """Per-recipe match vectors for one ingredient query"""
+    
+    def __init__(self, n_columns: int, n_recipes: int):
+        self.ingredients = []  # query ingredients (registry names where known), in order
+        self.detected = np.zeros(n_columns, dtype=np.float32)  # times each ingredient id was asked for
+        self.weights = np.zeros(n_columns, dtype=np.float32)  # match credit per ingredient id
+        self.matched = np.zeros(n_recipes, dtype=np.float32)  # matched ingredients per recipe
+        self.weighted = np.zeros(n_recipes, dtype=np.float32)  # confidence-weighted matches per recipe
+    
+    def copy(self) -> 'IngredientQuery':
+        query = IngredientQuery.__new__(IngredientQuery)
+        query.ingredients = list(self.ingredients)
+        query.detected = self.detected.copy()
+        query.weights = self.weights.copy()
+        query.matched = self.matched.copy()
+        query.weighted = self.weighted.copy()
+        return query
+
 class RecipeRecommender:
     """
     A simple recipe recommendation system based on ingredient matching.
@@ -12,73 +43,261 @@ class RecipeRecommender:
     
     def __init__(self, recipe_csv_path: str):
         """Initialize the recommender with the recipe database."""
-        self.df_recipe = pd.read_csv(recipe_csv_path, sep='\t')
-        self.ingredient_columns = [col for col in self.df_recipe.columns 
-                                  if col not in ['Unnamed: 0', 'FileName', 'IndexFile']]
+        # Compiled ids and ingredient bitmasks, shared by every consumer in the process
+        self.index = get_recipe_index(recipe_csv_path)
+        # Ingredient ids are column positions, and bit positions in recipe_masks
+        self.registry = get_ingredient_registry(recipe_csv_path)
+        self.ingredient_columns = self.registry.names
+        self.recipe_ids = self.index.ids
+        self.recipe_masks = self.index.masks
+        self.ingredient_counts = popcount(self.recipe_masks)
+        
+        # Dense 0/1 recipe x ingredient matrix for weighted dot-product scoring
+        column_bits = np.left_shift(np.uint32(1), np.arange(len(self.ingredient_columns), dtype=np.uint32))
+        # (column-major, so single-ingredient refinements read contiguous columns)
+        self.ingredient_matrix = np.asfortranarray(
+            ((self.recipe_masks[:, None] & column_bits) != 0).astype(np.float32)
+        )
         
-    def find_recipes_by_ingredients(self, ingredients: List[str], top_n: int = 7) -> List[int]:
+        # Dense id -> row position lookup (-1 for ids not in the index)
+        self.row_by_id = np.full(self.recipe_ids.max() + 1, -1, dtype=np.int32)
+        self.row_by_id[self.recipe_ids] = np.arange(len(self.recipe_ids), dtype=np.int32)
+        
+        # Ingredient names per row, shared by every recipe with the same mask
+        by_mask = {mask: tuple(self.registry.names_for_mask(int(mask)))
+                   for mask in np.unique(self.recipe_masks)}
+        self.recipe_ingredients = [by_mask[mask] for mask in self.recipe_masks]
+        
+        # Cold-start filler: recipes with common ingredients, in file order,
+        # until interaction data is available through set_popularity()
+        common_ingredients = ['Chicken', 'Beef', 'Egg', 'Tomato', 'Bread']
+        common_mask = np.uint32(self.registry.mask_for(common_ingredients))
+        self.default_popular_rows = np.flatnonzero(self.recipe_masks & common_mask)
+        self.popular_rows = self.default_popular_rows
+    
+    @property
+    def df_recipe(self) -> pd.DataFrame:
+        """Recipe table as a DataFrame (bool ingredient columns plus IndexFile)"""
+        return self.index.frame()
+        
+    def find_recipes_by_ingredients(self, ingredients: List[str], top_n: int = 7,
+                                    excluded_mask: int = 0,
+                                    confidences: Optional[Dict[str, float]] = None) -> List[int]:
         """
         Find recipes that match the given ingredients.
         
         Args:
             ingredients: List of ingredient names detected from the image
             top_n: Number of top recipes to return
+            excluded_mask: Bitmask (ingredient_columns layout) of forbidden
+                ingredients; recipes using any of them are never returned
+            confidences: Optional detection confidence (0-1) per ingredient;
+                when given, each match is weighted by its confidence
             
         Returns:
             List of recipe indices
         """
-        # Convert ingredient names to match column names in the CSV
-        ingredients = [ing.capitalize() for ing in ingredients]
-        
-        # Calculate match scores for each recipe
-        scores = []
-        for idx, row in self.df_recipe.iterrows():
-            score = 0
-            matched_ingredients = 0
-            
-            # Count how many of the detected ingredients are in this recipe
-            for ingredient in ingredients:
-                if ingredient in self.ingredient_columns and row[ingredient] == True:
-                    matched_ingredients += 1
-                    score += 10  # Base score for matching ingredient
-            
-            # Bonus for matching multiple ingredients
-            if matched_ingredients > 1:
-                score += matched_ingredients * 5
-            
-            # Penalty for having too many extra ingredients
-            total_ingredients = sum(row[col] == True for col in self.ingredient_columns)
-            if total_ingredients > 0:
-                score -= (total_ingredients - matched_ingredients) * 0.5
-            
-            scores.append((idx, score, matched_ingredients))
+        query = self.score_query(ingredients, confidences)
+        return self.rank_query(query, top_n=top_n, excluded_mask=excluded_mask)
+    
+    def score_query(self, ingredients: List[str],
+                    confidences: Optional[Dict[str, float]] = None) -> 'IngredientQuery':
+        """
+        Compute per-recipe match vectors for a set of ingredients.
         
-        # Sort by score (descending) and then by number of matched ingredients
-        scores.sort(key=lambda x: (x[1], x[2]), reverse=True)
+        The result can be cached and later refined one ingredient at a time
+        with refine_query() instead of being rescored from scratch.
+        """
+        if confidences:
+            confidences = {self.registry.resolve(name): confidence
+                           for name, confidence in confidences.items()}
         
-        # Get the top recipes
-        result = []
-        for idx, score, matched in scores[:top_n]:
-            if matched > 0:  # Only include recipes with at least one matching ingredient
-                index_file = self.df_recipe.iloc[idx]['IndexFile']
-                result.append(int(index_file))
+        query = IngredientQuery(len(self.registry), len(self.recipe_ids))
+        for ingredient in ingredients:
+            ingredient_id, ingredient = self._resolve(ingredient)
+            query.ingredients.append(ingredient)
+            if ingredient_id is not None:
+                query.detected[ingredient_id] += 1
+                query.weights[ingredient_id] += confidences.get(ingredient_id, 1.0) if confidences else 1.0
+        
+        # Matched ingredients and their weight per recipe, as dot products
+        query.matched[:] = self.ingredient_matrix @ query.detected
+        query.weighted[:] = self.ingredient_matrix @ query.weights
+        return query
+    
+    def refine_query(self, query: 'IngredientQuery', add: Dict[str, float] = None,
+                     remove: List[str] = ()) -> 'IngredientQuery':
+        """
+        Return a copy of ``query`` with ingredients added or removed.
+        
+        Each change adds or subtracts one ingredient column from the match
+        vectors, so no full rescore is needed.
+        
+        Args:
+            query: Query from score_query() or an earlier refinement
+            add: Ingredient name -> confidence to add
+            remove: Ingredient names to drop
+        """
+        refined = query.copy()
+        for ingredient in remove:
+            ingredient_id, ingredient = self._resolve(ingredient)
+            if ingredient not in refined.ingredients:
+                continue
+            refined.ingredients = [ing for ing in refined.ingredients if ing != ingredient]
+            if ingredient_id is not None:
+                column = self.ingredient_matrix[:, ingredient_id]
+                refined.matched -= refined.detected[ingredient_id] * column
+                refined.weighted -= refined.weights[ingredient_id] * column
+                refined.detected[ingredient_id] = 0
+                refined.weights[ingredient_id] = 0
+        
+        for ingredient, confidence in (add or {}).items():
+            ingredient_id, ingredient = self._resolve(ingredient)
+            if ingredient in refined.ingredients:
+                continue
+            refined.ingredients.append(ingredient)
+            if ingredient_id is not None:
+                column = self.ingredient_matrix[:, ingredient_id]
+                refined.matched += column
+                refined.weighted += confidence * column
+                refined.detected[ingredient_id] = 1
+                refined.weights[ingredient_id] = confidence
+        return refined
+    
+    def _resolve(self, ingredient: str) -> Tuple[Optional[int], str]:
+        """Registry id and canonical name for an ingredient (id None if unknown)"""
+        ingredient_id = self.registry.resolve(ingredient)
+        if ingredient_id is None:
+            return None, ingredient.capitalize()
+        return ingredient_id, self.registry.name(ingredient_id)
+    
+    def rank_query(self, query: 'IngredientQuery', top_n: int = 7,
+                   excluded_mask: int = 0) -> List[int]:
+        """Top recipe indices for a scored query (see find_recipes_by_ingredients)"""
+        # Round away float noise so refined and freshly scored queries tie alike
+        matched = query.matched
+        weighted = np.round(query.weighted, 4)
+        
+        # Base score per matching ingredient, bonus for matching several,
+        # penalty for each extra ingredient the recipe needs
+        scores = weighted.astype(np.float64) * 10
+        scores += np.where(matched > 1, weighted * 5, 0)
+        scores -= (self.ingredient_counts - matched) * 0.5
+        scores = np.round(scores, 4)
+        
+        # Drop restricted recipes before ranking so they never take a slot
+        rows = np.flatnonzero(self.allowed_rows(excluded_mask))
+        
+        # Sort by score, then matched weight (descending), file order on ties
+        order = np.lexsort((rows, -weighted[rows], -scores[rows]))
+        top_rows = rows[order[:top_n]]
+        
+        # Only include recipes with at least one matching ingredient
+        result = [int(recipe_id) for recipe_id in self.recipe_ids[top_rows[matched[top_rows] > 0]]]
         
         # If we don't have enough results, add some popular recipes
         if len(result) < top_n:
-            # Add recipes with common ingredients
-            common_ingredients = ['Chicken', 'Beef', 'Egg', 'Tomato', 'Bread']
-            for idx, row in self.df_recipe.iterrows():
-                if len(result) >= top_n:
-                    break
-                index_file = int(row['IndexFile'])
-                if index_file not in result:
-                    for ing in common_ingredients:
-                        if row[ing] == True:
-                            result.append(index_file)
-                            break
+            result.extend(self.get_popular_recipes(
+                top_n - len(result), exclude=result, excluded_mask=excluded_mask
+            ))
         
         return result[:top_n]
     
+    def rank_by_inventory(self, stocked: np.ndarray, urgency: np.ndarray, top_n: int = 7,
+                          excluded_mask: int = 0) -> List[int]:
+        """
+        Rank recipes by how much of them can be cooked from a pantry.
+        
+        Args:
+            stocked: 1.0 per ingredient column the user has in stock
+            urgency: Per ingredient column, 0-1 for how soon it expires
+            top_n: Number of recipes to return
+            excluded_mask: Bitmask of forbidden ingredients
+            
+        Returns:
+            Recipe indices using at least one stocked ingredient, best first
+        """
+        # One matrix product gives stocked ingredients and urgency per recipe
+        covered, urgent = (self.ingredient_matrix @ np.stack([stocked, urgency], axis=1)
+                           .astype(np.float32)).T
+        missing = self.ingredient_counts - covered
+        coverage = covered / np.maximum(self.ingredient_counts, 1)
+        
+        # Favor full coverage and using more of the pantry, then what expires soon
+        scores = np.round(coverage * 10 + covered + urgent * 5 - missing * 0.5, 4)
+        
+        rows = np.flatnonzero(self.allowed_rows(excluded_mask) & (covered > 0))
+        order = np.lexsort((rows, missing[rows], -scores[rows]))
+        return [int(recipe_id) for recipe_id in self.recipe_ids[rows[order[:top_n]]]]
+    
+    def row_for(self, recipe_id) -> Optional[int]:
+        """Row position of a recipe in the recipe index, or None if unknown"""
+        try:
+            key = recipe_key(recipe_id)
+        except (TypeError, ValueError):
+            return None
+        if key < 0 or key >= len(self.row_by_id):
+            return None
+        row = self.row_by_id[key]
+        return int(row) if row >= 0 else None
+    
+    def ingredients_for(self, recipe_id) -> Optional[Tuple[str, ...]]:
+        """Ingredient names used by a recipe, or None if unknown"""
+        row = self.row_for(recipe_id)
+        if row is None:
+            return None
+        return self.recipe_ingredients[row]
+    
+    def allowed_rows(self, excluded_mask: int = 0) -> np.ndarray:
+        """Boolean array of recipes that use none of the excluded ingredients"""
+        if not excluded_mask:
+            return np.ones(len(self.recipe_masks), dtype=bool)
+        return (self.recipe_masks & np.uint32(excluded_mask)) == 0
+    
+    def get_popular_recipes(self, top_n: int = 7, exclude: List[int] = (),
+                            excluded_mask: int = 0) -> List[int]:
+        """
+        Return the most popular recipes from the precomputed ranking.
+        
+        Args:
+            top_n: Number of recipes to return
+            exclude: Recipe indices to skip (e.g. already recommended)
+            excluded_mask: Bitmask of forbidden ingredients
+            
+        Returns:
+            List of recipe indices, most popular first
+        """
+        excluded = set(exclude)
+        result = []
+        for row in self.popular_rows:
+            if len(result) >= top_n:
+                break
+            if excluded_mask and self.recipe_masks[row] & excluded_mask:
+                continue
+            recipe_id = int(self.recipe_ids[row])
+            if recipe_id not in excluded:
+                result.append(recipe_id)
+        return result
+    
+    def set_popularity(self, scores: Dict[int, float]):
+        """
+        Rebuild the popularity ranking from interaction scores.
+        
+        Recipes with a positive score come first, highest score first; the
+        cold-start filler follows so the ranking never runs dry.
+        
+        Args:
+            scores: Popularity score per recipe index
+        """
+        engaged = sorted(
+            (recipe_id for recipe_id, score in scores.items() if score > 0),
+            key=lambda recipe_id: scores[recipe_id], reverse=True
+        )
+        engaged_rows = pd.Index(self.recipe_ids).get_indexer(engaged)
+        engaged_rows = engaged_rows[engaged_rows >= 0]
+        filler = self.default_popular_rows[~np.isin(self.default_popular_rows, engaged_rows)]
+        self.popular_rows = np.concatenate([engaged_rows, filler])
+    
     def find_similar_recipes(self, recipe_index: int, top_n: int = 5) -> List[int]:
         """
         Find recipes similar to a given recipe based on ingredient overlap.
@@ -91,24 +310,18 @@ class RecipeRecommender:
             List of similar recipe indices
         """
         # Find the row for the given recipe
-        ref_row = self.df_recipe[self.df_recipe['IndexFile'] == recipe_index].iloc[0]
-        ref_ingredients = set(col for col in self.ingredient_columns if ref_row[col] == True)
+        ref_row = self.row_for(recipe_index)
+        if ref_row is None:
+            raise IndexError(f"Unknown recipe {recipe_index}")
+        ref_mask = self.recipe_masks[ref_row]
         
-        similarities = []
-        for idx, row in self.df_recipe.iterrows():
-            if int(row['IndexFile']) == recipe_index:
-                continue
-                
-            # Calculate Jaccard similarity
-            recipe_ingredients = set(col for col in self.ingredient_columns if row[col] == True)
-            intersection = len(ref_ingredients.intersection(recipe_ingredients))
-            union = len(ref_ingredients.union(recipe_ingredients))
-            
-            if union > 0:
-                similarity = intersection / union
-                similarities.append((int(row['IndexFile']), similarity))
+        # Jaccard similarity of ingredient sets, straight from the bitmasks
+        intersection = popcount(self.recipe_masks & ref_mask)
+        union = popcount(self.recipe_masks | ref_mask)
+        rows = np.flatnonzero((union > 0) & (self.recipe_ids != recipe_key(recipe_index)))
+        similarity = intersection[rows] / union[rows]
         
         # Sort by similarity
-        similarities.sort(key=lambda x: x[1], reverse=True)
+        order = np.lexsort((rows, -similarity))
         
-        return [idx for idx, _ in similarities[:top_n]]
\ No newline at end of file
+        return [int(recipe_id) for recipe_id in self.recipe_ids[rows[order[:top_n]]]]
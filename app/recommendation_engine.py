@@ -1,77 +1,171 @@
 """
 Personalized Recipe Recommendation Engine
 """
-import pandas as pd
+import json
+import logging
+import threading
 import numpy as np
-from typing import List, Dict, Tuple
-from datetime import datetime, timedelta
-from sqlalchemy import func
-from .database import db, RecipeHistory, RecipeRating, UserPreference, RecipeFavorite
-from .recipe_recommender import RecipeRecommender
-from .auth_utils import filter_recipes_by_dietary_restrictions
+from typing import List, Dict, Optional
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, case
+from .database import db, upsert_insert, IngredientInventory, RecipeHistory, RecipeRating, RecipeStats, UserPreference, RecipeFavorite
+from .recipe_recommender import IngredientQuery, RecipeRecommender, recipe_key
+from .profile_cache import InventoryProfile, LRUCache, UserProfile
+from .ingredient_mapper import get_ingredient_mapper
+from .dietary_filter import RestrictionEngine
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 class PersonalizedRecommender:
     """
     Enhanced recipe recommender that learns from user behavior
     """
     
-    def __init__(self, csv_path: str):
+    def __init__(self, csv_path: str, profile_cache_size: int = 1024,
+                 profile_cache_ttl: float = 300):
         """Initialize with base recommender"""
         self.base_recommender = RecipeRecommender(csv_path)
+        self.restrictions = RestrictionEngine(self.base_recommender.registry)
+        self.profile_cache = LRUCache(max_size=profile_cache_size, ttl=profile_cache_ttl)
+        self.inventory_cache = LRUCache(max_size=profile_cache_size, ttl=profile_cache_ttl)
+        self.ingredient_mapper = get_ingredient_mapper()
         self.learning_rate = 0.1
         self.min_interactions = 3
+        # Only views this recent affect scoring (see _calculate_recipe_score)
+        self.history_window_days = 14
+        # Seconds between popularity ranking refreshes from RecipeStats
+        self.popularity_refresh_interval = 600
+        self._popularity_refreshed_at = None
+        self._popularity_lock = threading.Lock()
+        # Stock expiring within this many days raises a recipe's inventory score
+        self.expiry_horizon_days = 7
+        # Optional EventLog; when set, behavioural writes are logged and
+        # applied by an EventConsumer instead of inside the request
+        self.event_log = None
         
     def get_personalized_recipes(self, user, detected_ingredients: List[str], 
-                               top_n: int = 7) -> List[Dict]:
+                               top_n: int = 7,
+                               confidences: Optional[Dict[str, float]] = None,
+                               query: Optional[IngredientQuery] = None,
+                               update_preferences: bool = True) -> List[Dict]:
         """
         Get personalized recipe recommendations based on:
-        1. Detected ingredients
+        1. Detected ingredients (weighted by detection confidence, if given)
         2. User preferences
         3. Dietary restrictions
         4. Past behavior
+        
+        A precomputed ``query`` (see RecipeRecommender.score_query) skips
+        ingredient matching; refinements of an earlier request pass
+        ``update_preferences=False`` so they are not learned twice.
         """
         
+        # Dietary restrictions and allergies are applied inside the base
+        # search, so incompatible recipes never take a candidate slot
+        forbidden_mask = self.restrictions.forbidden_mask(user)
+        
         # Get base recommendations
-        base_recipes = self.base_recommender.find_recipes_by_ingredients(
-            detected_ingredients, top_n=top_n * 3  # Get more for filtering
+        if query is None:
+            query = self.base_recommender.score_query(detected_ingredients, confidences)
+        base_recipes = self.base_recommender.rank_query(
+            query, top_n=top_n * 3,  # Get more for re-ranking
+            excluded_mask=forbidden_mask
         )
         
         if not user or not user.is_authenticated:
             # Return base recommendations for non-authenticated users
             return self._format_recipes(base_recipes[:top_n])
         
-        # Get user preferences
-        user_prefs = self._get_user_preferences(user.id)
-        
-        # Get user history
-        user_history = self._get_user_history(user.id)
+        # Preferences, history, favorites and ratings (cached per user)
+        profile = self._get_user_profile(user.id)
         
         # Score recipes based on personalization
+        now = datetime.utcnow()
         scored_recipes = []
         for recipe_id in base_recipes:
             score = self._calculate_recipe_score(
-                recipe_id, user, user_prefs, user_history, detected_ingredients
+                recipe_id, profile, detected_ingredients, now
             )
             scored_recipes.append((recipe_id, score))
         
         # Sort by score (descending)
         scored_recipes.sort(key=lambda x: x[1], reverse=True)
-        
-        # Filter by dietary restrictions
-        filtered_recipes = []
-        for recipe_id, score in scored_recipes:
-            if self._check_dietary_compatibility(recipe_id, user):
-                filtered_recipes.append(recipe_id)
-                if len(filtered_recipes) >= top_n:
-                    break
+        top_recipes = [recipe_id for recipe_id, score in scored_recipes[:top_n]]
         
         # Track this interaction
-        self._update_user_preferences(user.id, detected_ingredients)
+        if update_preferences:
+            self._update_user_preferences(user.id, detected_ingredients)
+        
+        return self._format_recipes(top_recipes)
+    
+    def get_inventory_recipes(self, user, top_n: int = 7) -> List[Dict]:
+        """
+        Recommend recipes that use what the user has in stock.
+        
+        Recipes are ranked by how many of their ingredients are stocked,
+        with a bonus for ingredients that expire soon. Each recipe lists
+        the ingredients still missing.
+        """
+        inventory = self._get_user_inventory(user.id)
+        today = date.today()
+        stocked_days = inventory.in_stock(today)
+        if not stocked_days:
+            return []
+        
+        registry = self.base_recommender.registry
+        stocked = np.zeros(len(registry), dtype=np.float32)
+        urgency = np.zeros(len(registry), dtype=np.float32)
+        for ingredient_id, days_left in stocked_days.items():
+            stocked[ingredient_id] = 1.0
+            if days_left is not None and days_left < self.expiry_horizon_days:
+                urgency[ingredient_id] = 1.0 - days_left / self.expiry_horizon_days
+        
+        recipe_ids = self.base_recommender.rank_by_inventory(
+            stocked, urgency, top_n=top_n,
+            excluded_mask=self.restrictions.forbidden_mask(user)
+        )
+        
+        recipes = self._format_recipes(recipe_ids)
+        stocked_mask = inventory.stocked_mask(today)
+        for recipe in recipes:
+            row = self.base_recommender.row_for(recipe['recipe_id'])
+            recipe['missing_ingredients'] = registry.names_for_mask(
+                int(self.base_recommender.recipe_masks[row]) & ~stocked_mask
+            )
+        return recipes
+    
+    def _get_user_inventory(self, user_id: int) -> InventoryProfile:
+        """Get the user's stocked ingredients from the cache, loading them on a miss"""
+        inventory = self.inventory_cache.get(user_id)
+        if inventory is None:
+            inventory = self._load_user_inventory(user_id)
+            self.inventory_cache.set(user_id, inventory)
+        return inventory
+    
+    def _load_user_inventory(self, user_id: int) -> InventoryProfile:
+        """Resolve inventory items to recipe index ingredients"""
+        items = db.session.query(
+            IngredientInventory.ingredient, IngredientInventory.expiry_date
+        ).filter(
+            IngredientInventory.user_id == user_id,
+            IngredientInventory.quantity > 0
+        ).all()
         
-        return self._format_recipes(filtered_recipes)
+        # Several items can map to one ingredient; each keeps its own expiry
+        expiry_dates = {}
+        for name, expiry_date in items:
+            ingredient_id = self.ingredient_mapper.map_to_id(name)
+            if ingredient_id is not None:
+                expiry_dates.setdefault(ingredient_id, []).append(expiry_date)
+        return InventoryProfile(expiry_dates)
     
-    def _calculate_recipe_score(self, recipe_id: str, user, user_prefs: Dict,
-                              user_history: Dict, detected_ingredients: List[str]) -> float:
+    def invalidate_user_inventory(self, user_id: int):
+        """Drop a user's cached inventory (call after it changes)"""
+        self.inventory_cache.invalidate(user_id)
+    
+    def _calculate_recipe_score(self, recipe_id: str, profile: UserProfile,
+                              detected_ingredients: List[str], now: datetime) -> float:
         """Calculate personalized score for a recipe"""
         score = 0.0
         
@@ -79,35 +173,31 @@ class PersonalizedRecommender:
         score += 1.0
         
         # User preference score
+        ingredients = []
         recipe_data = self._get_recipe_data(recipe_id)
         if recipe_data:
             ingredients = recipe_data.get('ingredients', [])
             for ingredient in ingredients:
-                if ingredient in user_prefs:
+                if ingredient in profile.preferences:
                     # Add preference score (0-1)
-                    score += user_prefs[ingredient] * 0.5
+                    score += profile.preferences[ingredient] * 0.5
         
         # History score (penalize recently viewed recipes)
-        if recipe_id in user_history:
-            days_ago = user_history[recipe_id]
+        days_ago = profile.days_since_viewed(recipe_id, now)
+        if days_ago is not None:
             if days_ago < 7:
                 score -= 0.5  # Reduce score for recipes viewed in last week
             elif days_ago < 14:
                 score -= 0.2
         
         # Favorite bonus
-        is_favorite = RecipeFavorite.query.filter_by(
-            user_id=user.id, recipe_id=recipe_id
-        ).first()
-        if is_favorite:
+        if str(recipe_id) in profile.favorites:
             score += 0.8
         
         # Rating bonus
-        rating = RecipeRating.query.filter_by(
-            user_id=user.id, recipe_id=recipe_id
-        ).first()
+        rating = profile.ratings.get(str(recipe_id))
         if rating:
-            score += (rating.rating - 3) * 0.2  # -0.4 to +0.4 based on rating
+            score += (rating - 3) * 0.2  # -0.4 to +0.4 based on rating
         
         # Diversity bonus (prefer recipes with different ingredients)
         unique_ingredients = set(ingredients) - set(detected_ingredients)
@@ -115,25 +205,156 @@ class PersonalizedRecommender:
         
         return score
     
-    def _get_user_preferences(self, user_id: int) -> Dict[str, float]:
-        """Get user ingredient preferences"""
-        prefs = UserPreference.query.filter_by(user_id=user_id).all()
-        return {pref.ingredient: pref.preference_score for pref in prefs}
+    def refresh_popularity(self):
+        """Rebuild the base recommender's popularity ranking from RecipeStats"""
+        scores = {}
+        for stats in RecipeStats.query.all():
+            try:
+                scores[int(stats.recipe_id)] = stats.popularity
+            except ValueError:
+                continue
+        self.base_recommender.set_popularity(scores)
+        self._popularity_refreshed_at = datetime.utcnow()
     
-    def _get_user_history(self, user_id: int) -> Dict[str, int]:
-        """Get user recipe history with days since viewed"""
-        history = RecipeHistory.query.filter_by(user_id=user_id).all()
-        result = {}
+    def refresh_popularity_if_stale(self):
+        """Refresh the popularity ranking once per refresh interval"""
         now = datetime.utcnow()
+        with self._popularity_lock:
+            refreshed_at = self._popularity_refreshed_at
+            if refreshed_at is not None and \
+                    (now - refreshed_at).total_seconds() < self.popularity_refresh_interval:
+                return
+            # Claim this interval so concurrent requests keep the current ranking
+            self._popularity_refreshed_at = now
         
-        for item in history:
-            days_ago = (now - item.viewed_at).days
-            result[item.recipe_id] = days_ago
-            
-        return result
+        try:
+            self.refresh_popularity()
+        except Exception as e:
+            # Keep serving the previous ranking; retry on the next interval.
+            # The failed query leaves the request's transaction aborted on Postgres.
+            db.session.rollback()
+            logger.warning("Failed to refresh recipe popularity: %s", e)
+    
+    def _get_user_profile(self, user_id: int) -> UserProfile:
+        """Get the user's profile from the cache, loading it on a miss"""
+        profile = self.profile_cache.get(user_id)
+        if profile is None:
+            profile = self._load_user_profile(user_id)
+            self.profile_cache.set(user_id, profile)
+        return profile
+    
+    def _load_user_profile(self, user_id: int) -> UserProfile:
+        """Load preferences, history, favorites and ratings from the database"""
+        prefs = db.session.query(
+            UserPreference.ingredient, UserPreference.preference_score,
+            UserPreference.interaction_count
+        ).filter(UserPreference.user_id == user_id).all()
+        
+        favorites = db.session.query(RecipeFavorite.recipe_id).filter(
+            RecipeFavorite.user_id == user_id
+        ).all()
+        ratings = db.session.query(RecipeRating.recipe_id, RecipeRating.rating).filter(
+            RecipeRating.user_id == user_id
+        ).all()
+        
+        return UserProfile(
+            preferences={ingredient: score for ingredient, score, _ in prefs},
+            interaction_counts={ingredient: count or 0 for ingredient, _, count in prefs},
+            history=self._get_user_history(user_id),
+            favorites={recipe_id for (recipe_id,) in favorites},
+            ratings={recipe_id: rating for recipe_id, rating in ratings}
+        )
+    
+    def _get_user_history(self, user_id: int) -> Dict[str, datetime]:
+        """Get the latest view time per recipe within the scoring window"""
+        since = datetime.utcnow() - timedelta(days=self.history_window_days)
+        history = db.session.query(
+            RecipeHistory.recipe_id, func.max(RecipeHistory.viewed_at)
+        ).filter(
+            RecipeHistory.user_id == user_id,
+            RecipeHistory.viewed_at >= since
+        ).group_by(RecipeHistory.recipe_id).all()
+        
+        return {recipe_id: viewed_at for recipe_id, viewed_at in history}
+    
+    def invalidate_user_profile(self, user_id: int):
+        """Drop a cached profile after its favorites, ratings or cooks change"""
+        self.profile_cache.invalidate(user_id)
+    
+    def note_recipe_views(self, user_id: int, recipe_ids: List):
+        """Keep a cached profile's history current after recipes are shown"""
+        viewed_at = datetime.utcnow()
+        self.profile_cache.update(
+            user_id, lambda profile: profile.note_views(recipe_ids, viewed_at)
+        )
     
     def _update_user_preferences(self, user_id: int, ingredients: List[str]):
         """Update user preferences based on interaction"""
+        # Apply the same learning step to the cached profile
+        self.profile_cache.update(
+            user_id, lambda profile: profile.apply_preference_update(
+                ingredients, self.learning_rate, self.min_interactions
+            )
+        )
+        
+        if self.event_log is not None:
+            self.event_log.append('preference', {
+                'user_id': user_id, 'ingredients': list(ingredients)
+            })
+            return
+        
+        try:
+            self.apply_preference_update(user_id, ingredients)
+            db.session.commit()
+        except:
+            db.session.rollback()
+    
+    def apply_preference_update(self, user_id: int, ingredients: List[str]):
+        """Apply a preference update to the session without committing"""
+        ingredients = list(dict.fromkeys(ingredients))
+        if not ingredients:
+            return
+        
+        stmt = upsert_insert(UserPreference)
+        if stmt is None:
+            self._apply_preference_update_per_row(user_id, ingredients)
+            return
+        
+        # Apply every ingredient in one INSERT ... ON CONFLICT DO UPDATE
+        now = datetime.utcnow()
+        stmt = stmt.values([
+            {
+                'user_id': user_id,
+                'ingredient': ingredient,
+                'preference_score': 0.6,  # Start slightly positive
+                'interaction_count': 1,
+                'last_updated': now
+            }
+            for ingredient in ingredients
+        ])
+        
+        table = UserPreference.__table__
+        interaction_count = table.c.interaction_count + 1
+        learned_score = table.c.preference_score + \
+            self.learning_rate * (1 - table.c.preference_score)
+        
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'ingredient'],
+            set_={
+                'interaction_count': interaction_count,
+                # Increase preference score (with diminishing returns)
+                'preference_score': case(
+                    (interaction_count < self.min_interactions, table.c.preference_score),
+                    (learned_score > 1.0, 1.0),
+                    else_=learned_score
+                ),
+                'last_updated': stmt.excluded.last_updated
+            }
+        )
+        db.session.execute(stmt)
+    
+    def _apply_preference_update_per_row(self, user_id: int, ingredients: List[str]):
+        """Update preferences one row at a time for databases without upsert"""
         for ingredient in ingredients:
             pref = UserPreference.query.filter_by(
                 user_id=user_id, ingredient=ingredient
@@ -159,81 +380,39 @@ class PersonalizedRecommender:
                     )
                 
                 pref.last_updated = datetime.utcnow()
-        
-        try:
-            db.session.commit()
-        except:
-            db.session.rollback()
     
-    def _check_dietary_compatibility(self, recipe_id: str, user) -> bool:
-        """Check if recipe is compatible with user's dietary restrictions"""
-        recipe_data = self._get_recipe_data(recipe_id)
-        if not recipe_data:
-            return True  # Allow if we can't check
+    def _boost_user_preferences(self, user_id: int, ingredients: List[str],
+                                boost: float, interactions: int):
+        """Boost existing preferences for a set of ingredients in one UPDATE"""
+        if not ingredients:
+            return
         
-        ingredients = recipe_data.get('ingredients', [])
-        
-        # Check dietary restrictions
-        if user.is_vegetarian and any(ing in ['Beef', 'Pork', 'Chicken', 'Seafood', 
-                                              'Shrimp', 'Lobster', 'Crab', 'Squid', 
-                                              'Oyster', 'Tuna', 'Salmon'] for ing in ingredients):
-            return False
-            
-        if user.is_vegan and any(ing in ['Beef', 'Pork', 'Chicken', 'Seafood', 
-                                        'Shrimp', 'Lobster', 'Crab', 'Squid', 
-                                        'Oyster', 'Tuna', 'Salmon', 'Egg'] for ing in ingredients):
-            return False
-            
-        if user.is_halal and 'Pork' in ingredients:
-            return False
-            
-        if user.is_kosher and any(ing in ['Pork', 'Seafood', 'Shrimp', 'Lobster', 
-                                         'Crab', 'Squid', 'Oyster'] for ing in ingredients):
-            return False
-            
-        if user.is_gluten_free and 'Bread' in ingredients:
-            return False
-        
-        # Check allergies
-        allergies = user.get_allergies()
-        allergy_mapping = {
-            'eggs': ['Egg'],
-            'fish': ['Tuna', 'Salmon'],
-            'shellfish': ['Shrimp', 'Lobster', 'Crab', 'Oyster'],
-            'seafood': ['Seafood', 'Shrimp', 'Lobster', 'Crab', 'Squid', 'Oyster', 'Tuna', 'Salmon']
-        }
-        
-        for allergy in allergies:
-            if allergy in allergy_mapping:
-                if any(ing in allergy_mapping[allergy] for ing in ingredients):
-                    return False
-        
-        return True
+        boosted_score = UserPreference.preference_score + boost
+        UserPreference.query.filter(
+            UserPreference.user_id == user_id,
+            UserPreference.ingredient.in_(list(set(ingredients)))
+        ).update({
+            UserPreference.preference_score: case(
+                (boosted_score > 1.0, 1.0), else_=boosted_score
+            ),
+            UserPreference.interaction_count: UserPreference.interaction_count + interactions
+        }, synchronize_session=False)
     
-    def _get_recipe_data(self, recipe_id: str) -> Dict:
-        """Get recipe data from CSV"""
-        try:
-            # Get ingredients from CSV
-            df = self.base_recommender.df_recipe
-            if recipe_id in df.index:
-                row = df.loc[recipe_id]
-                ingredients = []
-                for col in self.base_recommender.ingredient_columns:
-                    if row[col] == True:
-                        ingredients.append(col)
-                return {'ingredients': ingredients}
-        except:
-            pass
-        return None
+    def _get_recipe_data(self, recipe_id) -> Dict:
+        """Get recipe data from the recipe index"""
+        ingredients = self.base_recommender.ingredients_for(recipe_id)
+        if ingredients is None:
+            return None
+        return {'ingredients': list(ingredients)}
     
-    def _format_recipes(self, recipe_ids: List[str]) -> List[Dict]:
+    def _format_recipes(self, recipe_ids: List[int]) -> List[Dict]:
         """Format recipe IDs into full recipe data"""
         recipes = []
         for recipe_id in recipe_ids:
             try:
                 # Load recipe JSON
-                import json
-                with open(f'./app/static/data/Food_recipe/food{recipe_id}.json', 'r') as f:
+                with metrics.timer('recipe_json'), \
+                        open(f'./app/static/data/Food_recipe/food{recipe_key(recipe_id):05d}.json', 'r') as f:
                     recipe_data = json.load(f)
                     recipe_data['recipe_id'] = recipe_id
                     recipes.append(recipe_data)
@@ -250,43 +429,43 @@ class PersonalizedRecommender:
         
         return recipes
     
-    def track_recipe_view(self, user_id: int, recipe_id: str, detected_ingredients: List[str]):
-        """Track when a user views a recipe"""
-        history = RecipeHistory(
-            user_id=user_id,
-            recipe_id=recipe_id,
-            detected_ingredients=json.dumps(detected_ingredients)
-        )
-        db.session.add(history)
+    def track_recipe_cooked(self, user_id: int, recipe_id: str):
+        """Track when a user cooks a recipe"""
+        # History rows store the canonical id, so "00033" must match "33"
+        recipe_id = str(recipe_key(recipe_id))
+        
+        if self.event_log is not None:
+            # The consumer drops the cached profile once the cook is committed
+            self.event_log.append('cooked', {
+                'user_id': user_id, 'recipe_id': str(recipe_id)
+            })
+            return
         
         try:
+            self.apply_recipe_cooked(user_id, recipe_id, datetime.utcnow())
             db.session.commit()
         except:
             db.session.rollback()
+        # After the commit, so a concurrent request cannot re-cache the old profile
+        self.invalidate_user_profile(user_id)
     
-    def track_recipe_cooked(self, user_id: int, recipe_id: str):
-        """Track when a user cooks a recipe"""
+    def apply_recipe_cooked(self, user_id: int, recipe_id: str, cooked_at: datetime):
+        """Mark the latest view as cooked and boost its ingredients (no commit)"""
         history = RecipeHistory.query.filter_by(
             user_id=user_id, recipe_id=recipe_id
         ).order_by(RecipeHistory.viewed_at.desc()).first()
         
         if history:
+            # Count a cook only when a view becomes cooked, as rebuild_recipe_stats does
+            if not history.cooked:
+                RecipeStats.apply_deltas(recipe_id, cooked_count=1)
             history.cooked = True
-            history.cooked_at = datetime.utcnow()
+            history.cooked_at = cooked_at
             
             # Boost preference for ingredients in this recipe
             recipe_data = self._get_recipe_data(recipe_id)
             if recipe_data:
-                for ingredient in recipe_data['ingredients']:
-                    pref = UserPreference.query.filter_by(
-                        user_id=user_id, ingredient=ingredient
-                    ).first()
-                    if pref:
-                        # Cooking a recipe is a strong positive signal
-                        pref.preference_score = min(1.0, pref.preference_score + 0.2)
-                        pref.interaction_count += 2
-        
-        try:
-            db.session.commit()
-        except:
-            db.session.rollback()
\ No newline at end of file
+                # Cooking a recipe is a strong positive signal
+                self._boost_user_preferences(
+                    user_id, recipe_data['ingredients'], boost=0.2, interactions=2
+                )
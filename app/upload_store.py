@@ -0,0 +1,136 @@
+"""
+Uploaded images kept in memory on the request path and written to disk behind it
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+from typing import Dict, Iterable, Optional
+
+from flask import Request
+
+logger = logging.getLogger(__name__)
+
+def image_extension(data: bytes) -> Optional[str]:
+    """File extension for the image format of ``data``, or None if it is not a supported image"""
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+def upload_name(data: bytes, extension: str) -> str:
+    """
+    Content-addressed name for an upload, relative to the upload folder.
+
+    ``ab/cd/abcd....jpg``: the two shard levels keep every directory to a
+    few hundred entries at millions of uploads, and the same photo uploaded
+    twice, by any worker, maps to the same file. Take ``extension`` from
+    ``image_extension`` so the client's filename cannot split one image
+    into several files.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+class InMemoryUploadRequest(Request):
+    """
+    Request that keeps uploaded files in memory.
+
+    Werkzeug spools files over 500 KB to a temporary file, so a phone photo
+    was written to disk once by the form parser and again by ``save()``.
+    MAX_CONTENT_LENGTH already caps the body, so a BytesIO per file is
+    bounded the same way.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return BytesIO()
+
+class UploadWriter:
+    """
+    Writes upload bytes to disk on a small thread pool.
+
+    The request hands over bytes it has already decoded and returns; pages
+    that show an upload call ``wait()`` first, so the browser never asks
+    for an image that is still being written.
+
+    Pending writes are only known to the worker process that accepted the
+    upload. Behind several workers the redirect to ``/kitchen`` can land on
+    another one, so ``wait()`` also polls briefly for files it has no write
+    for; the write-then-rename in ``_write`` means a file that exists is
+    complete.
+    """
+
+    def __init__(self, max_workers: int = 2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-writer')
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Future] = {}  # path -> write in flight
+
+    def save(self, path: str, data: bytes) -> Future:
+        """Queue ``data`` to be written to ``path``"""
+        future = self._executor.submit(self._write, path, data)
+        with self._lock:
+            self._pending[path] = future
+        future.add_done_callback(lambda done: self._finished(path, done))
+        return future
+
+    def wait(self, paths: Iterable[str], timeout: float = 10.0, poll_timeout: float = 2.0,
+             poll_interval: float = 0.05) -> bool:
+        """
+        Block until ``paths`` are on disk; returns whether all of them are.
+
+        Writes pending in this process are waited for up to ``timeout``
+        (failures are logged, not raised); other missing files are polled
+        for up to ``poll_timeout``, in case another worker is writing them.
+        """
+        poll_deadline = time.monotonic() + poll_timeout
+        present = True
+        for path in paths:
+            with self._lock:
+                future = self._pending.get(path)
+            if future is not None:
+                try:
+                    future.result(timeout)
+                except Exception:
+                    # Already logged by _finished, or still running after the timeout
+                    pass
+
+            while not os.path.exists(path) and time.monotonic() < poll_deadline:
+                time.sleep(poll_interval)
+            present = present and os.path.exists(path)
+        return present
+
+    @staticmethod
+    def _write(path: str, data: bytes):
+        # Content-addressed: an existing file already holds these bytes
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Readers see either no file or the whole file, never a partial write
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _finished(self, path: str, future: Future):
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+        error = future.exception()
+        if error is not None:
+            logger.error("Could not save upload %s: %s", path, error)
+
+# Shared by the upload and kitchen views
+upload_writer = UploadWriter()
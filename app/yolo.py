@@ -1,8 +1,12 @@
 import cv2
+import logging
 import numpy as np
 from pathlib import Path
 import os
-from .ingredient_mapper import IngredientMapper
+from .ingredient_mapper import get_ingredient_mapper, DetectionResult, FALLBACK_CONFIDENCE, HINT_CONFIDENCE
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 # Get the directory of this file
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -35,8 +39,7 @@ def load_yolo():
         colors = np.random.uniform(0, 255, size=(len(classes), 3))
         return net, classes, colors, output_layers
     except Exception as e:
-        print(f"Warning: Failed to load YOLO model: {e}")
-        print("Using intelligent fallback detection based on uploaded image analysis")
+        logger.warning("Failed to load YOLO model, using fallback detection from image analysis: %s", e)
         # Load COCO classes for fallback
         try:
             with open(YOLO_NAME, "r") as f:
@@ -52,16 +55,24 @@ def load_yolo():
         colors = np.random.uniform(0, 255, size=(len(classes), 3))
         return None, classes, colors, None
 
-def load_image(img_path):
-    # image loading
-    img = cv2.imread(img_path)
-    if np.sum(img) != 0:
+def decode_image(data):
+    """Decode encoded image bytes (JPEG, PNG, ...) to a BGR array, or None"""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def prepare_image(img):
+    """Downscale a full-size image for detection"""
+    if img is not None and np.sum(img) != 0:
         img = cv2.resize(img, None, fx=0.4, fy=0.4)
         height, width, channels = img.shape
         return img, height, width, channels
-    else:
-        print('khong co anh')
-        pass
+    return None, 0, 0, 0
+
+def load_image(img_path):
+    # image loading
+    img, height, width, channels = prepare_image(cv2.imread(img_path))
+    if img is None:
+        logger.warning("Empty image: %s", img_path)
+    return img, height, width, channels
 
 def detect_objects(img, net, outputLayers):
     if net is None:
@@ -197,17 +208,28 @@ def analyze_image_features(image):
 
 def image_detect(img_path):
     """Enhanced image detection with robust ingredient mapping"""
-    # Initialize ingredient mapper
-    mapper = IngredientMapper()
+    return detect_with_confidence(img_path).ingredients
+
+def detect_with_confidence(img_path, image_data=None) -> DetectionResult:
+    """
+    Like image_detect, but keeps the detector confidence for each ingredient.
+    
+    With ``image_data`` (the encoded upload), the image is decoded from
+    memory and ``img_path`` is only used as a label; otherwise it is read
+    from ``img_path`` once and shared by every detector.
+    """
+    # Shared ingredient mapper (compiled once per process)
+    mapper = get_ingredient_mapper()
     
     # Load YOLO model
     model, classes, colors, output_layers = load_yolo()
     
     # Load and analyze image first
-    image, height, width, channels = load_image(img_path)
+    original = decode_image(image_data) if image_data is not None else cv2.imread(img_path)
+    image, height, width, channels = prepare_image(original)
     if image is None:
-        print(f"Error: Could not load image from {img_path}")
-        return ['Chicken', 'Tomato']  # Default fallback
+        logger.error("Could not load image from %s", img_path)
+        return DetectionResult({'Chicken': FALLBACK_CONFIDENCE, 'Tomato': FALLBACK_CONFIDENCE})  # Default fallback
     
     # Get image features for enhanced detection
     image_features = analyze_image_features(image)
@@ -217,17 +239,19 @@ def image_detect(img_path):
     
     if use_advanced_detection or model is None:
         # Use advanced Hugging Face food detection
-        print("Using Advanced AI food detection with multiple models")
+        logger.debug("Using advanced AI food detection for %s", img_path)
         
+        metrics.count('model_invocations', model='advanced')
         try:
             from .food_detector_advanced import get_advanced_food_detector
             detector = get_advanced_food_detector()
-            detected_objects = detector.detect_ingredients(img_path)
-            print(f"AI detected ingredients: {detected_objects}")
+            detections = detector.detect_ingredients_with_confidence(img_path, image=original)
+            logger.debug("AI detected ingredients: %s", detections)
         except Exception as e:
-            print(f"Advanced detection failed: {e}")
+            logger.warning("Advanced detection failed: %s", e)
             # Simple fallback - ensure we always return something
-            detected_objects = ['chicken', 'tomato', 'potato']
+            detections = [(item, FALLBACK_CONFIDENCE) for item in ['chicken', 'tomato', 'potato']]
+        detected_objects = [item for item, _ in detections]
         
         # Create a mock prediction image
         font = cv2.FONT_HERSHEY_SIMPLEX
@@ -236,18 +260,19 @@ def image_detect(img_path):
         cv2.imwrite(PATH_SAVE_DETECTED, image)
         
         # Map to valid ingredients
-        ingredients = mapper.map_multiple(detected_objects)
+        ingredients = mapper.map_with_confidence(detections)
         if not ingredients:
-            ingredients = ['Chicken', 'Tomato', 'Egg']
+            ingredients = DetectionResult(dict.fromkeys(['Chicken', 'Tomato', 'Egg'], FALLBACK_CONFIDENCE))
         
-        print(f"Fallback detected ingredients: {ingredients}")
+        logger.debug("Mapped ingredients: %s", ingredients.confidences, extra={'image': img_path})
         return ingredients
     
     # YOLO detection when model is available
+    metrics.count('model_invocations', model='yolo')
     blob, outputs = detect_objects(image, model, output_layers)
     boxes, confs, class_ids = get_box_dimensions(outputs, height, width)
     
-    print(f"YOLO detected {len(boxes)} objects with {len(class_ids)} classifications")
+    logger.debug("YOLO detected %d objects with %d classifications", len(boxes), len(class_ids))
     
     # Draw bounding boxes
     draw_labels(boxes, confs, colors, class_ids, classes, image)
@@ -263,15 +288,15 @@ def image_detect(img_path):
                 confidence = confs[i]
                 detected_objects.append(class_name)
                 detected_with_confidence.append((class_name, confidence))
-                print(f"Detected: {class_name} (confidence: {confidence:.2f})")
+                logger.debug("Detected: %s (confidence: %.2f)", class_name, confidence)
     
     # Sort by confidence and take top detections
     detected_with_confidence.sort(key=lambda x: x[1], reverse=True)
-    top_detections = [item[0] for item in detected_with_confidence[:10]]
+    top_detections = detected_with_confidence[:10]
     
     # If no objects detected, use image features
     if not detected_objects:
-        print("No objects detected by YOLO, using enhanced color analysis")
+        logger.debug("No objects detected by YOLO, using enhanced color analysis")
         # Use color-based detection as fallback
         if 'dominant_colors' in image_features:
             for color in image_features['dominant_colors']:
@@ -284,8 +309,11 @@ def image_detect(img_path):
                 elif color == 'brown':
                     detected_objects.extend(['mushroom', 'beef'])
     
-    # Map detected objects to valid ingredients
-    ingredients = mapper.enhance_detection(top_detections if top_detections else detected_objects, image_features)
+    # Map detected objects to valid ingredients (color guesses get a hint-level confidence)
+    ingredients = mapper.enhance_with_confidence(
+        top_detections if top_detections else [(obj, HINT_CONFIDENCE) for obj in detected_objects],
+        image_features
+    )
     
     # Ensure we always return something meaningful
     if not ingredients:
@@ -298,7 +326,7 @@ def image_detect(img_path):
             ['Salmon', 'Cucumber', 'Tomato']
         ]
         import random
-        ingredients = random.choice(fallback_sets)
+        ingredients = DetectionResult(dict.fromkeys(random.choice(fallback_sets), FALLBACK_CONFIDENCE))
     
-    print(f"Final detected ingredients: {ingredients}")
+    logger.debug("Final detected ingredients: %s", ingredients.confidences, extra={'image': img_path})
     return ingredients
\ No newline at end of file
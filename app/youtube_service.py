@@ -3,12 +3,17 @@ YouTube API Service for recipe videos
 """
 import os
 import json
+import logging
 import requests
 from typing import List, Dict, Optional
 from urllib.parse import urlencode
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
 class YouTubeService:
     """Service for fetching recipe videos from YouTube"""
     
@@ -23,7 +28,7 @@ class YouTubeService:
         try:
             self.youtube = build('youtube', 'v3', developerKey=self.api_key)
         except Exception as e:
-            print(f"Failed to initialize YouTube service: {e}")
+            logger.warning("Failed to initialize YouTube service: %s", e)
     
     def search_recipe_videos(self, recipe_name: str, max_results: int = 3) -> List[Dict]:
         """
@@ -43,6 +48,7 @@ class YouTubeService:
         try:
             # Search for videos
             search_query = f"how to cook {recipe_name} recipe"
+            metrics.count('external_calls', service='youtube', call='search')
             search_response = self.youtube.search().list(
                 q=search_query,
                 part='id,snippet',
@@ -75,6 +81,7 @@ class YouTubeService:
             # Get additional details like duration
             if video_ids:
                 try:
+                    metrics.count('external_calls', service='youtube', call='videos')
                     videos_response = self.youtube.videos().list(
                         part='contentDetails',
                         id=','.join(video_ids)
@@ -90,10 +97,11 @@ class YouTubeService:
             return videos
             
         except HttpError as e:
-            print(f"YouTube API error: {e}")
+            metrics.count('external_call_errors', service='youtube')
+            logger.warning("YouTube API error: %s", e)
             return self._fallback_search(recipe_name)
         except Exception as e:
-            print(f"Error searching YouTube: {e}")
+            logger.warning("Error searching YouTube: %s", e)
             return self._fallback_search(recipe_name)
     
     def _parse_duration(self, duration: str) -> str:
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Offline benchmarks for the upload -> detect -> recommend -> render pipeline
+
+Usage:
+    python benchmarks/run_benchmarks.py                  # run everything
+    python benchmarks/run_benchmarks.py recommend e2e    # run selected benchmarks
+    python benchmarks/run_benchmarks.py --save           # store results as the baseline
+    python benchmarks/run_benchmarks.py --compare        # fail on p50 regressions vs the baseline
+
+Needs no network: YouTube is stubbed, the database is a throwaway SQLite
+file and uploads go to a temporary directory.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+RECIPE_CSV = os.path.join(ROOT_DIR, 'app/static/data/File_name.csv')
+RECIPE_DIR = os.path.join(ROOT_DIR, 'app/static/data/Food_recipe')
+UPLOAD_IMAGES = os.path.join(ROOT_DIR, 'app/static/images/upload')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# Detector labels as YOLO, CLIP and Food-101 produce them
+LABELS = [
+    'banana', 'apple', 'carrot', 'hot dog', 'pizza', 'broccoli', 'chicken', 'cow',
+    'person', 'bottle', 'sandwich', 'fried rice', 'red pepper', 'lettuce', 'chicken wings',
+    'beef tartare', 'salmon fillet', 'tomatoes', 'mushrom', 'eggs benedict', 'crab cakes',
+    'bacon', 'steak', 'prawns', 'squid ink', 'dining table', 'white', 'round'
+]
+
+def summarize(samples, elapsed):
+    """Latency percentiles (ms) and throughput (ops/s) for one benchmark"""
+    latencies = np.array(samples) * 1000
+    return {
+        'iterations': len(samples),
+        'mean_ms': round(float(latencies.mean()), 4),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 4),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 4),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 4),
+        'throughput': round(len(samples) / elapsed, 2) if elapsed else 0.0
+    }
+
+def measure(func, iterations, warmup=3):
+    """Time ``func(i)`` for each iteration after a few untimed warmup calls"""
+    for i in range(warmup):
+        func(i)
+    samples = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - t)
+    return summarize(samples, time.perf_counter() - start)
+
+def bench_recommend(iterations, rng):
+    from app.recipe_recommender import RecipeRecommender
+    recommender = RecipeRecommender(RECIPE_CSV)
+    names = recommender.ingredient_columns
+    queries = [rng.sample(names, rng.randint(1, 5)) for _ in range(iterations + 3)]
+    return measure(lambda i: recommender.find_recipes_by_ingredients(queries[i], top_n=15), iterations)
+
+def bench_similar(iterations, rng):
+    from app.recipe_recommender import RecipeRecommender
+    recommender = RecipeRecommender(RECIPE_CSV)
+    ids = [int(recipe_id) for recipe_id in rng.sample(list(recommender.recipe_ids), iterations + 3)]
+    return measure(lambda i: recommender.find_similar_recipes(ids[i], top_n=5), iterations)
+
+def bench_mapper(iterations, rng):
+    from app.ingredient_mapper import IngredientMapper
+    mapper = IngredientMapper()
+    batches = [rng.sample(LABELS, 6) for _ in range(iterations + 3)]
+    return measure(lambda i: mapper.map_multiple(batches[i]), iterations)
+
+def bench_mapper_uncached(iterations, rng):
+    from app.ingredient_mapper import IngredientMapper
+    mapper = IngredientMapper()
+    batches = [rng.sample(LABELS, 6) for _ in range(iterations + 3)]
+    # Bypass the label memo to time the compiled tables themselves
+    return measure(lambda i: [mapper._resolve_label(label) for label in batches[i]], iterations)
+
+def bench_recipe_json(iterations, rng):
+    paths = glob.glob(os.path.join(RECIPE_DIR, 'food*.json'))
+    picks = [rng.choice(paths) for _ in range(iterations + 3)]
+
+    def load(i):
+        with open(picks[i]) as f:
+            json.load(f)
+
+    return measure(load, iterations)
+
+def bench_yolo_decode(iterations, rng):
+    from app import yolo
+    # YOLOv3 output shapes for a 416x416 input: 3 scales x 3 anchors, 85 values each
+    generator = np.random.default_rng(rng.randint(0, 2 ** 31))
+    outputs = []
+    for cells in (13, 26, 52):
+        output = generator.random((cells * cells * 3, 85), dtype=np.float32)
+        output[:, 5:] *= 0.2  # Mostly background, a few boxes over the threshold
+        outputs.append(output)
+    return measure(lambda i: yolo.get_box_dimensions(outputs, 480, 640), iterations)
+
+def bench_image_load(iterations, rng):
+    from app import yolo
+    images = sorted(glob.glob(os.path.join(UPLOAD_IMAGES, '*.jpg')))
+    return measure(lambda i: yolo.load_image(images[i % len(images)]), iterations)
+
+def bench_e2e(iterations, rng, workdir):
+    """POST an upload image to ``/`` and render the ``/kitchen`` page it redirects to"""
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+
+    # Install the offline YouTube service before the app grabs the shared one
+    from app import youtube_service as youtube_module
+
+    class OfflineYouTubeService(youtube_module.YouTubeService):
+        """Answers with the built-in placeholder videos, never the API"""
+
+        def _init_service(self):
+            self.youtube = None
+
+    youtube_module.youtube_service = OfflineYouTubeService(api_key='offline')
+
+    from app import yolo
+    from app.app import app
+    upload_dir = os.path.join(workdir, 'upload')
+    os.makedirs(upload_dir, exist_ok=True)
+    app.config['UPLOAD_FOLDER'] = upload_dir
+    app.config['WTF_CSRF_ENABLED'] = False
+    yolo.PATH_SAVE_DETECTED = os.path.join(workdir, 'predict.jpg')
+
+    images = sorted(glob.glob(os.path.join(UPLOAD_IMAGES, '*.jpg')))
+    client = app.test_client()
+    stages = {'upload': [], 'kitchen': []}
+
+    def run(i, record=True):
+        path = images[i % len(images)]
+        t = time.perf_counter()
+        with open(path, 'rb') as f:
+            response = client.post('/', data={'files': (f, os.path.basename(path))},
+                                   content_type='multipart/form-data')
+        uploaded = time.perf_counter()
+        if response.status_code != 302:
+            raise RuntimeError(f"Upload of {path} returned {response.status_code}")
+        page = client.get(response.headers['Location'])
+        if page.status_code != 200:
+            raise RuntimeError(f"Kitchen page for {path} returned {page.status_code}")
+        if record:
+            stages['upload'].append(uploaded - t)
+            stages['kitchen'].append(time.perf_counter() - uploaded)
+
+    for i in range(3):
+        run(i, record=False)
+    start = time.perf_counter()
+    for i in range(iterations):
+        run(i)
+    elapsed = time.perf_counter() - start
+
+    totals = [a + b for a, b in zip(stages['upload'], stages['kitchen'])]
+    return {
+        'e2e': summarize(totals, elapsed),
+        'e2e_upload': summarize(stages['upload'], sum(stages['upload'])),
+        'e2e_kitchen': summarize(stages['kitchen'], sum(stages['kitchen']))
+    }
+
+BENCHMARKS = {
+    'recommend': (bench_recommend, 500),
+    'similar': (bench_similar, 500),
+    'mapper': (bench_mapper, 2000),
+    'mapper_uncached': (bench_mapper_uncached, 500),
+    'recipe_json': (bench_recipe_json, 1000),
+    'yolo_decode': (bench_yolo_decode, 50),
+    'image_load': (bench_image_load, 100),
+    'e2e': (bench_e2e, 30)
+}
+
+def compare(results, baseline, tolerance):
+    """Print p50 changes against a baseline; return the names that regressed"""
+    regressions = []
+    print(f"\n{'benchmark':<18}{'baseline p50':>14}{'p50':>12}{'change':>10}")
+    for name, result in results.items():
+        before = baseline.get('results', {}).get(name)
+        if not before:
+            print(f"{name:<18}{'-':>14}{result['p50_ms']:>12.3f}{'new':>10}")
+            continue
+        change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0.0
+        flag = ' !' if change > tolerance else ''
+        print(f"{name:<18}{before['p50_ms']:>14.3f}{result['p50_ms']:>12.3f}{change:>+10.1%}{flag}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('benchmarks', nargs='*',
+                        help=f"Benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument('--iterations', type=int, help='Override the iterations of every benchmark')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline file to save or compare')
+    parser.add_argument('--save', action='store_true', help='Save the results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='Compare against the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed p50 slowdown before --compare fails (default 0.2 = 20%%)')
+    args = parser.parse_args()
+    unknown = [name for name in args.benchmarks if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    # The app loads its data through paths relative to the repository root
+    os.chdir(ROOT_DIR)
+    workdir = tempfile.mkdtemp(prefix='kitchenking-bench-')
+
+    results = {}
+    print(f"{'benchmark':<18}{'iters':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>11}")
+    for name in args.benchmarks or BENCHMARKS:
+        func, iterations = BENCHMARKS[name]
+        iterations = args.iterations or iterations
+        rng = random.Random(args.seed)
+        if name == 'e2e':
+            outcome = func(iterations, rng, workdir)
+        else:
+            outcome = {name: func(iterations, rng)}
+
+        for result_name, result in outcome.items():
+            results[result_name] = result
+            print(f"{result_name:<18}{result['iterations']:>7}{result['p50_ms']:>10.3f}"
+                  f"{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}{result['throughput']:>11.1f}")
+
+    if args.save:
+        baseline = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results
+        }
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f"\nNo baseline at {args.baseline}; run with --save first")
+            return 1
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,12 +7,18 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app.app import app, db
+from app.database import ensure_indexes
 
 with app.app_context():
     # Create all tables
     db.create_all()
     print("Database tables created successfully!")
     
+    # Add indexes declared after the tables were first created
+    created = ensure_indexes()
+    if created:
+        print(f"Created indexes: {', '.join(created)}")
+    
     # List created tables
     from sqlalchemy import inspect
     inspector = inspect(db.engine)
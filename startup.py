@@ -28,4 +28,13 @@ try:
 except Exception as e:
     print(f"Warning: Could not load transformers: {e}")
 
+try:
+    print("Compiling recipe index...")
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.recipe_index import build_recipe_index
+    index = build_recipe_index('./app/static/data/File_name.csv')
+    print(f"Recipe index compiled ({len(index)} recipes)")
+except Exception as e:
+    print(f"Warning: Could not compile recipe index: {e}")
+
 print("Preloading complete!")
\ No newline at end of file
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test that the interaction event consumer gets past events it cannot apply
+"""
+import os
+import sys
+import tempfile
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+
+from app.database import db, RecipeHistory, UserPreference
+from app.event_log import EventLog, EventConsumer
+from app.recipe_recommender import RecipeRecommender
+from app.recommendation_engine import PersonalizedRecommender
+
+RECIPE_CSV = './app/static/data/File_name.csv'
+
+def make_app(workdir):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'test.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+def test_malformed_event_is_dead_lettered():
+    """A bad event is retried, then set aside, and later events still get applied"""
+    workdir = tempfile.mkdtemp()
+    app = make_app(workdir)
+    event_log = EventLog(os.path.join(workdir, 'events.db'))
+    consumer = EventConsumer(app, event_log, PersonalizedRecommender(RECIPE_CSV), max_attempts=3)
+
+    event_log.append('view', {'user_id': 1, 'recipe_ids': [12]})  # no detected_ingredients
+    event_log.append('view', {'user_id': 1, 'recipe_ids': [33], 'detected_ingredients': ['Egg']})
+    event_log.append('preference', {'user_id': 1, 'ingredients': ['Egg', 'Bread']})
+
+    # Each poll fails once on the bad event until it runs out of attempts
+    assert consumer.process_batch() == 0
+    assert consumer.process_batch() == 0
+    assert consumer.process_batch() == 3
+
+    assert event_log.pending_count() == 0
+    assert event_log.dead_count() == 1
+    with app.app_context():
+        assert [row.recipe_id for row in RecipeHistory.query.all()] == ['33']
+        assert {pref.ingredient for pref in UserPreference.query.filter_by(user_id=1)} == {'Egg', 'Bread'}
+
+def test_cached_profile_dropped_after_commit():
+    """A profile cached before the consumer runs is reloaded once the event is applied"""
+    workdir = tempfile.mkdtemp()
+    app = make_app(workdir)
+    event_log = EventLog(os.path.join(workdir, 'events.db'))
+    recommender = PersonalizedRecommender(RECIPE_CSV)
+    consumer = EventConsumer(app, event_log, recommender)
+
+    event_log.append('preference', {'user_id': 1, 'ingredients': ['Egg']})
+    with app.app_context():
+        assert recommender._get_user_profile(1).preferences == {}
+
+    consumer.drain()
+    with app.app_context():
+        assert recommender._get_user_profile(1).preferences == {'Egg': 0.6}
+
+def test_plain_recommender_skips_personal_events():
+    """Without a PersonalizedRecommender, views apply and cooks are skipped, not retried forever"""
+    workdir = tempfile.mkdtemp()
+    app = make_app(workdir)
+    event_log = EventLog(os.path.join(workdir, 'events.db'))
+    consumer = EventConsumer(app, event_log, RecipeRecommender(RECIPE_CSV))
+
+    event_log.append('cooked', {'user_id': 1, 'recipe_id': '33'})
+    event_log.append('view', {'user_id': 1, 'recipe_ids': [33], 'detected_ingredients': []})
+
+    assert consumer.drain() == 2
+    assert event_log.pending_count() == 0
+    assert event_log.dead_count() == 0
+    with app.app_context():
+        assert RecipeHistory.query.count() == 1
+
+if __name__ == "__main__":
+    test_malformed_event_is_dead_lettered()
+    test_cached_profile_dropped_after_commit()
+    test_plain_recommender_skips_personal_events()
+    print("Event log tests passed")
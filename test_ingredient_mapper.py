@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test that detector labels resolve to recipe index ingredients
+"""
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+
+from app.ingredient_embeddings import NgramEncoder, WordVectorEncoder
+from app.ingredient_mapper import IngredientMapper
+
+class FakeVectors:
+    """The slice of gensim's KeyedVectors that WordVectorEncoder reads"""
+
+    def __init__(self, vectors):
+        self.key_to_index = {word: i for i, word in enumerate(vectors)}
+        self._vectors = {word: np.array(vector, dtype=np.float32) for word, vector in vectors.items()}
+
+    def __getitem__(self, word):
+        return self._vectors[word]
+
+# Four directions: leafy greens, red meat, fish, tools
+WORD_VECTORS = FakeVectors({
+    'salad': [1.0, 0.0, 0.0, 0.0], 'lettuce': [0.9, 0.1, 0.0, 0.0], 'arugula': [0.95, 0.0, 0.1, 0.0],
+    'beef': [0.0, 1.0, 0.0, 0.0], 'steak': [0.1, 0.9, 0.0, 0.0], 'brisket': [0.0, 0.95, 0.1, 0.0],
+    'salmon': [0.0, 0.0, 1.0, 0.0], 'fillet': [0.0, 0.5, 0.5, 0.0], 'trout': [0.1, 0.0, 0.95, 0.0],
+    'spanner': [0.1, 0.1, 0.1, 1.0],
+})
+
+def make_mapper():
+    # Spelling matches only, so results do not depend on the deployment's models
+    return IngredientMapper(encoder=NgramEncoder())
+
+def test_food101_and_clip_labels():
+    """The mapping tables cover the labels named in the semantic mapping request"""
+    mapper = make_mapper()
+    assert mapper.map_to_ingredient('red pepper') == 'Tomato'
+    assert mapper.map_to_ingredient('lettuce') == 'Salad'
+    assert mapper.map_to_ingredient('fried rice') == 'Egg'
+    assert mapper.map_to_ingredient('fried_rice') == 'Egg'
+
+def test_misspellings_resolve_by_nearest_ingredient():
+    mapper = make_mapper()
+    assert mapper.map_to_ingredient('chiken') == 'Chicken'
+    assert mapper.map_to_ingredient('tomatoe') == 'Tomato'
+    assert mapper.map_to_ingredient('carot') == 'Carrot'
+    assert mapper.map_to_ingredient('mushrom') == 'Mushroom'
+
+def test_spelling_fallback_rejects_other_words():
+    """A real word one letter away from an ingredient is not a misspelling of it"""
+    mapper = make_mapper()
+    assert mapper.map_to_ingredient('beet') is None
+    assert mapper.map_to_ingredient('spanner') is None
+
+def test_word_vectors_resolve_related_labels():
+    """Labels in no table and spelled like no ingredient resolve by meaning"""
+    mapper = IngredientMapper(encoder=WordVectorEncoder(WORD_VECTORS))
+    assert mapper.map_to_ingredient('arugula') == 'Salad'
+    assert mapper.map_to_ingredient('brisket') == 'Beef'
+    assert mapper.map_to_ingredient('smoked trout') == 'Salmon'
+    # Not close to anything, or unknown to the vectors
+    assert mapper.map_to_ingredient('spanner') is None
+    assert mapper.map_to_ingredient('beet') is None
+    # Out-of-vocabulary misspellings still fall back to spelling
+    assert mapper.map_to_ingredient('chiken') == 'Chicken'
+
+def test_word_vector_encoder_skips_unknown_words():
+    encoder = WordVectorEncoder(WORD_VECTORS)
+    assert encoder.encode('gravel') is None
+    np.testing.assert_allclose(encoder.encode('salmon fillet'), [0.0, 0.25, 0.75, 0.0])
+    np.testing.assert_allclose(encoder.encode('salmon_gravel'), [0.0, 0.0, 1.0, 0.0])
+
+def test_non_food_labels_are_ignored():
+    """COCO objects without an ingredient never reach the fuzzy steps"""
+    mapper = make_mapper()
+    for label in ['car', 'fork', 'person', 'orange', 'banana', 'sheep']:
+        assert mapper.map_to_ingredient(label) is None, label
+    assert mapper.unmapped_targets == []
+
+if __name__ == "__main__":
+    test_food101_and_clip_labels()
+    test_misspellings_resolve_by_nearest_ingredient()
+    test_spelling_fallback_rejects_other_words()
+    test_word_vectors_resolve_related_labels()
+    test_word_vector_encoder_skips_unknown_words()
+    test_non_food_labels_are_ignored()
+    print("Ingredient mapper tests passed")
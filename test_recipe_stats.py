@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test that incrementally maintained recipe stats match a full rebuild
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import Flask
+
+from app.database import db, RecipeHistory, RecipeStats
+from app.maintenance import compact_recipe_history, rebuild_recipe_stats
+from app.recommendation_engine import PersonalizedRecommender
+
+RECIPE_CSV = './app/static/data/File_name.csv'
+
+def make_app(workdir):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(workdir, 'test.db')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+def cooked_counts():
+    return {stats.recipe_id: stats.cooked_count for stats in RecipeStats.query.all()}
+
+def test_cooked_count_matches_rebuild():
+    """Repeated cooks and cooks without a view do not inflate cooked_count"""
+    app = make_app(tempfile.mkdtemp())
+    recommender = PersonalizedRecommender(RECIPE_CSV)
+    with app.app_context():
+        viewed_at = datetime.utcnow() - timedelta(days=40)
+        for user_id, recipe_id in [(1, '33'), (1, '12'), (2, '33')]:
+            db.session.add(RecipeHistory(user_id=user_id, recipe_id=recipe_id, viewed_at=viewed_at))
+        db.session.commit()
+
+        for user_id, recipe_id in [(1, '33'), (1, '33'), (2, '33'), (1, '99')]:
+            recommender.apply_recipe_cooked(user_id, recipe_id, datetime.utcnow())
+            db.session.commit()
+        assert cooked_counts() == {'33': 2}
+
+        # Cooks rolled up into summaries still count; the kept latest view is already cooked
+        compact_recipe_history(retention_days=30)
+        recommender.apply_recipe_cooked(1, '33', datetime.utcnow())
+        db.session.commit()
+
+        incremental = cooked_counts()
+        rebuild_recipe_stats()
+        rebuilt = {recipe_id: count for recipe_id, count in cooked_counts().items() if count}
+        assert incremental == rebuilt == {'33': 2}
+
+def test_cook_after_compaction():
+    """A recipe last viewed before the retention window can still be marked cooked"""
+    app = make_app(tempfile.mkdtemp())
+    recommender = PersonalizedRecommender(RECIPE_CSV)
+    with app.app_context():
+        for days_ago in (60, 45):
+            db.session.add(RecipeHistory(user_id=1, recipe_id='12',
+                                         viewed_at=datetime.utcnow() - timedelta(days=days_ago)))
+        db.session.commit()
+
+        assert compact_recipe_history(retention_days=30) == 1
+        recommender.apply_recipe_cooked(1, '12', datetime.utcnow())
+        db.session.commit()
+
+        assert RecipeHistory.query.filter_by(user_id=1, recipe_id='12', cooked=True).count() == 1
+        incremental = cooked_counts()
+        rebuild_recipe_stats()
+        assert incremental == cooked_counts() == {'12': 1}
+
+if __name__ == "__main__":
+    test_cooked_count_matches_rebuild()
+    test_cook_after_compaction()
+    print("Recipe stats tests passed")
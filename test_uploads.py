@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test the in-memory upload path and the upload store
+"""
+import glob
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from io import BytesIO
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+WORKDIR = tempfile.mkdtemp(prefix='kitchenking-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(WORKDIR, 'test.db')
+
+from flask import Flask, request
+
+from app import youtube_service as youtube_module
+from app import yolo
+from app.upload_store import InMemoryUploadRequest, UploadWriter
+
+class OfflineYouTubeService(youtube_module.YouTubeService):
+    """Answers with the built-in placeholder videos, never the API"""
+
+    def _init_service(self):
+        self.youtube = None
+
+youtube_module.youtube_service = OfflineYouTubeService(api_key='offline')
+
+from app.app import app
+
+# Keep the annotated detection image out of the source tree
+yolo.PATH_SAVE_DETECTED = os.path.join(WORKDIR, 'predict.jpg')
+UPLOAD_IMAGES = sorted(glob.glob('./app/static/images/upload/*.jpg'))
+
+def make_client():
+    upload_dir = tempfile.mkdtemp(dir=WORKDIR)
+    app.config['UPLOAD_FOLDER'] = upload_dir
+    app.config['WTF_CSRF_ENABLED'] = False
+    return app.test_client(), upload_dir
+
+def test_large_upload_stays_in_memory():
+    """Files over Werkzeug's 500 KB spooling limit are not written to a temp file"""
+    probe = Flask(__name__)
+    probe.request_class = InMemoryUploadRequest
+
+    @probe.route('/', methods=['POST'])
+    def stream_type():
+        return type(request.files['file'].stream).__name__
+
+    data = {'file': (BytesIO(os.urandom(600 * 1024)), 'big.jpg')}
+    response = probe.test_client().post('/', data=data, content_type='multipart/form-data')
+    assert response.get_data(as_text=True) == 'BytesIO'
+
+def test_detect_from_bytes_matches_file():
+    path = UPLOAD_IMAGES[0]
+    with open(path, 'rb') as f:
+        data = f.read()
+    from_file = yolo.detect_with_confidence(path)
+    from_bytes = yolo.detect_with_confidence(path, image_data=data)
+    assert from_bytes.confidences == from_file.confidences
+
+def test_upload_then_kitchen():
+    """The kitchen page renders and the upload is on disk by the time it does"""
+    client, upload_dir = make_client()
+    with open(UPLOAD_IMAGES[0], 'rb') as f:
+        response = client.post('/', data={'files': (f, 'photo.jpg')}, content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    page = client.get(response.headers['Location'])
+    assert page.status_code == 200
+    saved = glob.glob(os.path.join(upload_dir, '**', '*.jpg'), recursive=True)
+    assert len(saved) == 1
+
+def test_wait_polls_for_files_from_other_workers():
+    """A file written by another process is waited for; a missing one gives up"""
+    writer = UploadWriter()
+    path = os.path.join(tempfile.mkdtemp(dir=WORKDIR), 'other.jpg')
+
+    def other_worker():
+        time.sleep(0.2)
+        UploadWriter._write(path, b'jpeg bytes')
+
+    threading.Thread(target=other_worker).start()
+    assert writer.wait([path], poll_timeout=2.0)
+    assert not writer.wait([path + '.missing'], poll_timeout=0.2)
+
+def test_same_image_is_stored_once():
+    """The same bytes under different names and requests land in one sharded file"""
+    client, upload_dir = make_client()
+    with open(UPLOAD_IMAGES[0], 'rb') as f:
+        data = f.read()
+
+    for names in [('photo.JPG', 'photo.jpeg'), ('again.jpg',)]:
+        files = [(BytesIO(data), name) for name in names]
+        response = client.post('/', data={'files': files}, content_type='multipart/form-data')
+        assert response.status_code == 302
+        assert client.get(response.headers['Location']).status_code == 200
+
+    digest = hashlib.sha256(data).hexdigest()
+    stored = [os.path.relpath(path, upload_dir)
+              for path in glob.glob(os.path.join(upload_dir, '**', '*'), recursive=True)
+              if os.path.isfile(path)]
+    assert stored == [os.path.join(digest[:2], digest[2:4], f'{digest}.jpg')]
+
+def test_non_image_upload_is_rejected():
+    client, upload_dir = make_client()
+    data = {'files': (BytesIO(b'not an image'), 'notes.jpg')}
+    response = client.post('/', data=data, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert '/kitchen/' not in response.headers['Location']
+    assert os.listdir(upload_dir) == []
+
+if __name__ == "__main__":
+    test_large_upload_stays_in_memory()
+    test_detect_from_bytes_matches_file()
+    test_upload_then_kitchen()
+    test_wait_polls_for_files_from_other_workers()
+    test_same_image_is_stored_once()
+    test_non_image_upload_is_rejected()
+    print("Upload tests passed")